@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source"))
+
+import sql
+
+SIZES = [10000, 50000, 100000]
+REPEATS = 3
+
+def keys(names):
+    return [(name, 0) for name in names]
+
+def reload(n):
+    # the usual gallery reload, a few new images on top and some deleted
+    old = [f"{i:08}.png" for i in range(n, 0, -1)]
+    deleted = set(random.sample(old, n // 100))
+    new = [f"{i:08}.png" for i in range(n + 3, n, -1)] + [f for f in old if not f in deleted]
+    return keys(old), keys(new)
+
+def reverse(n):
+    old = [f"{i:08}.png" for i in range(n)]
+    return keys(old), keys(old[::-1])
+
+def shuffle(n):
+    old = [f"{i:08}.png" for i in range(n)]
+    new = list(old)
+    for _ in range(n // 100):
+        a, b = random.randrange(n), random.randrange(n)
+        new[a], new[b] = new[b], new[a]
+    return keys(old), keys(new)
+
+def apply(old, new, removed, inserted):
+    out = list(old)
+    for first, last in removed:
+        del out[first:last+1]
+    for first, last in inserted:
+        out[first:first] = new[first:last+1]
+    return out
+
+def measure(old, new):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        removed, inserted, kept = sql.diffResults(old, new)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    if apply(old, new, removed, inserted) != new:
+        raise AssertionError("diff doesn't reproduce the new results")
+    return best, len(removed) + len(inserted)
+
+if __name__ == "__main__":
+    random.seed(0)
+    print(f"{'case':<10}{'rows':>8}{'time':>12}{'ranges':>10}")
+    for name, make in [("reload", reload), ("reverse", reverse), ("shuffle", shuffle)]:
+        for n in SIZES:
+            old, new = make(n)
+            elapsed, ranges = measure(old, new)
+            print(f"{name:<10}{n:>8}{elapsed*1000:>10.1f}ms{ranges:>10}")
@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source"))
+
+import PIL.Image
+import PIL.PngImagePlugin
+
+import metadata
+import parameters
+
+COUNT = 300
+SIZE = (512, 512)
+REPEATS = 7
+
+PROMPT = "a photograph of an astronaut riding a horse, highly detailed, " * 4
+SETTINGS = "Steps: 25, Sampler: Euler a, CFG scale: 7, Seed: {}, Size: 512x512, Model: sd-v1-5"
+
+def makeInfo(i):
+    # the mix of text chunks found in a typical output folder
+    info = PIL.PngImagePlugin.PngInfo()
+    kind = i % 4
+    if kind == 0:
+        info.add_text("parameters", f"{PROMPT}\nNegative prompt: blurry\n" + SETTINGS.format(i))
+    elif kind == 1:
+        info.add_text("parameters", f"{PROMPT}\nNegative prompt: blurry\n" + SETTINGS.format(i), zip=True)
+    elif kind == 2:
+        info.add_itxt("parameters", f"{PROMPT} ✨\nNegative prompt: blurry\n" + SETTINGS.format(i))
+    else:
+        info.add_text("Description", PROMPT)
+        info.add_text("Comment", json.dumps({"uc": "blurry", "steps": 28, "sampler": "k_euler", "scale": 11, "seed": i}))
+    return info
+
+def makeFiles(folder):
+    files = []
+    for i in range(COUNT):
+        noise = bytes(random.getrandbits(8) for _ in range(256)) * (SIZE[0] * SIZE[1] * 3 // 256)
+        image = PIL.Image.frombytes("RGB", SIZE, noise)
+        file = os.path.join(folder, f"{i:05}.png")
+        image.save(file, pnginfo=makeInfo(i))
+        files += [file]
+    return files
+
+def readPIL(file):
+    # what the gallery did before, info holds the text chunks in front of the image data
+    with PIL.Image.open(file) as img:
+        w, h = img.size
+        text = {k: str(v) for k, v in img.info.items() if isinstance(v, str)}
+        return w, h, parameters.getTextParameters(text)
+
+def readChunks(file):
+    w, h, text = metadata.readPNG(file)
+    return w, h, parameters.getTextParameters(text)
+
+def measure(read, files):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        out = [read(f) for f in files]
+        elapsed = (time.perf_counter() - start) / len(files)
+        best = elapsed if best == None else min(best, elapsed)
+    return best, out
+
+if __name__ == "__main__":
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as folder:
+        files = makeFiles(folder)
+        pil, expected = measure(readPIL, files)
+        chunks, results = measure(readChunks, files)
+    if results != expected:
+        raise AssertionError("metadata.readPNG disagrees with PIL")
+    print(f"{COUNT} PNGs {SIZE[0]}x{SIZE[1]}, best of {REPEATS}")
+    print(f"PIL.Image.open + info:   {pil*1e6:8.1f} us/file")
+    print(f"metadata.readPNG:        {chunks*1e6:8.1f} us/file ({pil/chunks:.1f}x)")
@@ -0,0 +1,75 @@
+import os
+import io
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source"))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import PIL.Image
+from PyQt5.QtCore import QByteArray
+from PyQt5.QtGui import QGuiApplication, QImage
+
+import thumbnails
+
+COUNT = 10
+QUALITY = 75
+SIZES = [(256, 256), (640, 640)]
+SOURCES = [("png", 512), ("png", 2048), ("jpg", 2048)]
+
+def old_thumbnail(file, size):
+    # the previous request path, a JPEG encoded in the worker and decoded again for QML
+    blob = io.BytesIO()
+    image = PIL.Image.open(file).convert('RGB')
+    image.thumbnail(size, PIL.Image.LANCZOS)
+    image.save(blob, "JPEG", quality=QUALITY)
+    return QImage.fromData(QByteArray(blob.getvalue()), "JPG")
+
+def new_thumbnail(file, size):
+    return thumbnails.get_thumbnail(file, size)
+
+def makeFiles(folder, format, size):
+    # smooth content compresses like real outputs do, unlike pure noise
+    files = []
+    for i in range(COUNT):
+        seed = bytes(random.getrandbits(8) for _ in range(32 * 32 * 3))
+        image = PIL.Image.frombytes("RGB", (32, 32), seed).resize((size, size), PIL.Image.BICUBIC)
+        file = os.path.join(folder, f"{size}_{i:03}.{format}")
+        if format == "jpg":
+            image.save(file, quality=90)
+        else:
+            image.save(file)
+        files += [file]
+    return files
+
+def measure(make, files, size):
+    make(files[0], size)
+    start = time.perf_counter()
+    for file in files:
+        image = make(file, size)
+    return (time.perf_counter() - start) / len(files), image
+
+def measureHits(size, files):
+    # a memory cache hit used to decode the cached JPEG, now it's the QImage itself
+    blob = thumbnails.encode_thumbnail(new_thumbnail(files[0], size), QUALITY)
+    start = time.perf_counter()
+    for _ in range(1000):
+        thumbnails.decode_thumbnail(blob)
+    return (time.perf_counter() - start) / 1000
+
+if __name__ == "__main__":
+    app = QGuiApplication([])
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"{'source':<10}{'size':>6}{'old':>12}{'new':>12}")
+        for format, source in SOURCES:
+            files = makeFiles(folder, format, source)
+            for size in SIZES:
+                old, oldImage = measure(old_thumbnail, files, size)
+                new, newImage = measure(new_thumbnail, files, size)
+                if oldImage.size() != newImage.size():
+                    raise AssertionError("thumbnail sizes differ")
+                print(f"{format} {source:<6}{size[0]:>6}{old*1000:>10.1f}ms{new*1000:>10.1f}ms  ({old/new:.1f}x)")
+        print(f"memory hit, old JPEG decode: {measureHits(SIZES[0], files)*1000:.2f}ms")
@@ -60,6 +60,20 @@ def QImagetoPIL(img):
         total = size[0]*size[1]*4
         return PIL.Image.frombytes("RGBA", size, img.bits().asarray(total), "raw", "RGBA")
 
+def QImagetoPILView(img):
+    # shares the pixel buffer rather than round tripping through an encoded format
+    if img.hasAlphaChannel():
+        img = img.convertToFormat(QImage.Format_RGBA8888)
+        mode = "RGBA"
+    else:
+        img = img.convertToFormat(QImage.Format_RGB888)
+        mode = "RGB"
+    bits = img.constBits()
+    bits.setsize(img.sizeInBytes())
+    image = PIL.Image.frombuffer(mode, (img.width(), img.height()), bits, "raw", mode, img.bytesPerLine(), 1)
+    image.source = img
+    return image
+
 def QImagetoCV2(img):
     img = img.convertToFormat(QImage.Format_RGBA8888)
     size = (img.size().width(), img.size().height())
@@ -1,11 +1,19 @@
-import glob
 import os
 
-from PyQt5.QtCore import pyqtSlot, pyqtSignal, QObject, QThreadPool, QRunnable, QFileSystemWatcher
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, QObject, QRunnable, QFileSystemWatcher
+
+import pools
+
+def canonical(path):
+    # one spelling per file, QML hands out forward slashes and Windows paths are case insensitive
+    return os.path.normcase(os.path.abspath(path))
 
 class WatcherRunnableSignals(QObject):
-    result = pyqtSignal(str, list, list)
+    result = pyqtSignal(str, list, list, list)
     finished = pyqtSignal(str, int)
+    diff = pyqtSignal(str, list, list, list, list)
+    updated = pyqtSignal(str, int)
+    listing = pyqtSignal(str, object)
     def __init__(self, folder):
         super().__init__()
         self.stopping = False
@@ -17,41 +25,111 @@ class WatcherRunnableSignals(QObject):
             self.stopping = True
 
 class WatcherRunnable(QRunnable):
-    def __init__(self, folder):
+    def __init__(self, folder, previous=None, extensions=None):
         super(WatcherRunnable, self).__init__()
         self.signals = WatcherRunnableSignals(folder)
         self.folder = folder
+        self.previous = previous
+        self.extensions = extensions
     
+    def scan(self):
+        files = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if self.signals.stopping:
+                    return None
+                name = entry.name
+                if name.startswith(".") or not "." in name:
+                    continue
+                if self.extensions and not name.rsplit(".",1)[-1].lower() in self.extensions:
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files[os.path.abspath(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
     @pyqtSlot()
     def run(self):
         try:
-            files = glob.glob(os.path.join(self.folder, "*.*"))
-            files = sorted(files, key = os.path.getmtime, reverse=True)
-
-            file_batch = []
-            idx_batch = []
-            batch_size = 128
-            for i, file in enumerate(files):
-                if self.signals.stopping:
-                    return
-                file_batch += [os.path.abspath(file)]
-                idx_batch += [len(files)-1-i]
-                if len(file_batch) >= batch_size or i == len(files) - 1:
-                    self.signals.result.emit(self.folder, file_batch, idx_batch)
-                    file_batch = []
-                    idx_batch = []
+            files = self.scan()
+            if files == None:
+                return
             
-            if not self.signals.stopping:
-                self.signals.finished.emit(self.folder, len(files))
+            if self.previous == None:
+                self.full(files)
+            else:
+                self.incremental(files)
         except Exception:
             return
 
+    def full(self, files):
+        files = sorted(files.items(), key = lambda f: f[1][0], reverse=True)
+        listing = {}
+
+        file_batch = []
+        idx_batch = []
+        stat_batch = []
+        batch_size = 128
+        for i, (file, (mtime, size)) in enumerate(files):
+            if self.signals.stopping:
+                return
+            idx = len(files)-1-i
+            listing[file] = (mtime, size, idx)
+            file_batch += [file]
+            idx_batch += [idx]
+            stat_batch += [(mtime, size)]
+            if len(file_batch) >= batch_size or i == len(files) - 1:
+                self.signals.result.emit(self.folder, file_batch, idx_batch, stat_batch)
+                file_batch = []
+                idx_batch = []
+                stat_batch = []
+        
+        if not self.signals.stopping:
+            self.signals.listing.emit(self.folder, listing)
+            self.signals.finished.emit(self.folder, len(files))
+
+    def incremental(self, files):
+        previous = self.previous
+        listing = {}
+
+        removed = [file for file in previous if not file in files]
+        changed = []
+        added = []
+        for file, (mtime, size) in files.items():
+            if not file in previous:
+                added += [(mtime, file)]
+                continue
+            old_mtime, old_size, idx = previous[file]
+            listing[file] = (mtime, size, idx)
+            if old_mtime != mtime or old_size != size:
+                changed += [(file, idx)]
+
+        idx = max([e[2] for e in previous.values()] + [-1]) + 1
+        for mtime, file in sorted(added):
+            listing[file] = (mtime, files[file][1], idx)
+            changed += [(file, idx)]
+            idx += 1
+
+        if self.signals.stopping:
+            return
+
+        self.signals.listing.emit(self.folder, listing)
+        if changed or removed:
+            self.signals.diff.emit(self.folder, [f for f, _ in changed], [i for _, i in changed], [files[f] for f, _ in changed], removed)
+        self.signals.updated.emit(self.folder, len(files))
+
 class Watcher(QObject):
     started = pyqtSignal(str)
     parent_changed = pyqtSignal(str)
-    folder_changed = pyqtSignal(str, list, list)
+    folder_changed = pyqtSignal(str, list, list, list)
+    folder_diff = pyqtSignal(str, list, list, list, list)
     file_changed = pyqtSignal(str)
     finished = pyqtSignal(str, int)
+    updated = pyqtSignal(str, int)
     kill = pyqtSignal(str)
 
     instance = None
@@ -64,9 +142,13 @@ class Watcher(QObject):
 
         self.folders = set()
         self.parents = {}
+        self.paths = {}
 
-        self.pool = QThreadPool.globalInstance()
+        self.pool = pools.get("scan")
         self.running = {}
+        self.listings = {}
+        self.extensions = {}
+        self.held = {}
 
         Watcher.instance = self
 
@@ -85,13 +167,16 @@ class Watcher(QObject):
         self.watcher.removePath(file)
         
     @pyqtSlot(str)
-    def watchFolder(self, folder):
+    def watchFolder(self, folder, extensions=None):
         if folder in self.folders:
             return
         
         self.folders.add(folder)
+        if extensions:
+            self.extensions[folder] = extensions
         parentFolder = os.path.dirname(folder)
         self.parents[folder] = parentFolder
+        self.paths[canonical(folder)] = folder
 
         self.watcher.addPath(folder)
         self.watcher.addPath(parentFolder)
@@ -103,25 +188,87 @@ class Watcher(QObject):
         self.kill.emit(folder)
 
         self.folders.remove(folder)
+        self.listings.pop(folder, None)
+        self.extensions.pop(folder, None)
         parent = self.parents[folder]
         del self.parents[folder]
+        self.paths.pop(canonical(folder), None)
 
         self.watcher.removePath(folder)
         if not parent in self.parents.values():
             self.watcher.removePath(parent)
 
+    def adopt(self, folder, files, stats):
+        # files the app put there itself, the next scan won't report them again
+        if not folder in self.listings:
+            return []
+        listing = dict(self.listings[folder])
+        idx = max([e[2] for e in listing.values()] + [-1]) + 1
+        idxs = []
+        for file, (mtime, size) in zip(files, stats):
+            listing[file] = (mtime, size, idx)
+            idxs += [idx]
+            idx += 1
+        self.listings[folder] = listing
+        return idxs
+
+    def stamp(self, file):
+        # (mtime, size) as of the last scan, so lookups don't need to touch the disk
+        file = os.path.abspath(file)
+        folder = self.paths.get(canonical(os.path.dirname(file)), None)
+        if folder == None:
+            return None
+        # listings are keyed by the paths the scan built from the watched folder
+        file = os.path.join(os.path.abspath(folder), os.path.basename(file))
+        entry = self.listings.get(folder, {}).get(file, None)
+        return entry[:2] if entry else None
+
+    def forget(self, files):
+        # listings can be shared with a running scan, so they are replaced rather than modified
+        files = set(files)
+        for folder, listing in list(self.listings.items()):
+            if any(file in listing for file in files):
+                self.listings[folder] = {k:v for k,v in listing.items() if not k in files}
+
+    def hold(self, folder):
+        # the app is changing the folder itself, scans wait until it's done
+        count, pending = self.held.get(folder, (0, False))
+        if folder in self.running:
+            self.watcherStop(folder)
+            pending = True
+        self.held[folder] = (count + 1, pending)
+
+    def release(self, folder):
+        count, pending = self.held.pop(folder, (1, False))
+        if count > 1:
+            self.held[folder] = (count - 1, pending)
+        elif pending:
+            self.watcherStart(folder)
+
+    def watcherStop(self, folder):
+        for signal in [self.running[folder].signals.result, self.running[folder].signals.finished, self.running[folder].signals.diff,
+                       self.running[folder].signals.updated, self.running[folder].signals.listing]:
+            signal.disconnect()
+        self.kill.emit(folder)
+        del self.running[folder]
+
     def watcherStart(self, folder):
         if self.stopping:
             return
 
+        if folder in self.held:
+            self.held[folder] = (self.held[folder][0], True)
+            return
+
         if folder in self.running:
-            self.running[folder].signals.result.disconnect()
-            self.running[folder].signals.finished.disconnect()
-            self.kill.emit(folder)
+            self.watcherStop(folder)
 
-        watcher = WatcherRunnable(folder)
+        watcher = WatcherRunnable(folder, self.listings.get(folder, None), self.extensions.get(folder, None))
         watcher.signals.result.connect(self.onWatcherResult)
         watcher.signals.finished.connect(self.onWatcherFinished)
+        watcher.signals.diff.connect(self.onWatcherDiff)
+        watcher.signals.updated.connect(self.onWatcherUpdated)
+        watcher.signals.listing.connect(self.onWatcherListing)
         self.kill.connect(watcher.signals.die)
 
         self.running[folder] = watcher
@@ -144,6 +291,7 @@ class Watcher(QObject):
             for child, parent in list(self.parents.items()):
                 if parent == folder:
                     self.watcher.addPath(child)
+                    self.listings.pop(child, None)
                     self.watcherStart(child)
 
     @pyqtSlot(str, int)
@@ -152,6 +300,21 @@ class Watcher(QObject):
             del self.running[folder]
         self.finished.emit(folder, total)
 
-    @pyqtSlot(str, list, list)
-    def onWatcherResult(self, folder, files, idxs):
-        self.folder_changed.emit(folder, files, idxs)
\ No newline at end of file
+    @pyqtSlot(str, list, list, list)
+    def onWatcherResult(self, folder, files, idxs, stats):
+        self.folder_changed.emit(folder, files, idxs, stats)
+
+    @pyqtSlot(str, int)
+    def onWatcherUpdated(self, folder, total):
+        if folder in self.running:
+            del self.running[folder]
+        self.updated.emit(folder, total)
+
+    @pyqtSlot(str, list, list, list, list)
+    def onWatcherDiff(self, folder, files, idxs, stats, removed):
+        self.folder_diff.emit(folder, files, idxs, stats, removed)
+
+    @pyqtSlot(str, object)
+    def onWatcherListing(self, folder, listing):
+        if folder in self.folders:
+            self.listings[folder] = listing
\ No newline at end of file
@@ -26,6 +26,7 @@ import wildcards
 import translation
 import misc
 import parameters
+import pools
 
 NAME = "qDiffusion"
 
@@ -73,7 +74,6 @@ class GUI(QObject):
         super().__init__(parent)
         self.db = sql.Database(self)
         self.watcher = filesystem.Watcher()
-        self.thumbnails = thumbnails.ThumbnailStorage((256,256),(640, 640),75, self)
         
         self.tabs = []
         
@@ -102,9 +102,20 @@ class GUI(QObject):
             "swap": False, "advanced": False, "autocomplete": 1, "vocab": [], "enforce_versions": True,
             "host_enabled": False, "host_address": "127.0.0.1", "host_port": 28888, "host_tunnel": False,
             "host_read_only": True, "host_monitor": False, "tabs": [], "grid_save_all": False,
-            "scaling": False
+            "scaling": False, "gallery_index": True, "thumbnail_cache": os.path.join("cache", "thumbnails"), "thumbnail_cache_size": 512,
+            "thumbnail_memory_size": 128, "thumbnail_memory_big_size": 64,
+            "scan_threads": 4, "decode_threads": 0, "write_threads": 2, "read_threads": 0,
+            "output_format": "png", "output_quality": 95, "output_compression": -1, "output_optimize": False, "output_lossless": True
         })
         self._config.updated.connect(self.onConfigUpdated)
+
+        pools.configure({name: int(self._config._values.get(f"{name}_threads")) for name in ["scan", "decode", "write", "read"]})
+
+        cacheFolder = self._config._values.get("thumbnail_cache")
+        cacheSize = int(self._config._values.get("thumbnail_cache_size")) * 1024 * 1024
+        memorySize = int(self._config._values.get("thumbnail_memory_size")) * 1024 * 1024
+        memoryBigSize = int(self._config._values.get("thumbnail_memory_big_size")) * 1024 * 1024
+        self.thumbnails = thumbnails.ThumbnailStorage((256,256),(640, 640),75, self, cacheFolder, cacheSize, (memorySize, memoryBigSize))
         self._remoteStatus = RemoteStatusMode.INACTIVE
 
         self._modelFolders = []
@@ -128,16 +139,26 @@ class GUI(QObject):
         self._options = {}
         self._empty = {}
         self._results = {}
+        self._resultData = {}
 
         parent.aboutToQuit.connect(self.stop)
 
         self.watcher.finished.connect(self.onFolderChanged)
+        self.watcher.updated.connect(self.onFolderChanged)
+        self.watcher.folder_changed.connect(parameters.INDEX_ALLOCATOR.onFolderChanged)
+        self.watcher.folder_diff.connect(parameters.INDEX_ALLOCATOR.onFolderChanged)
 
     @pyqtSlot()
     def stop(self):
         self.aboutToQuit.emit()
         self.backend.wait()
         self.watcher.wait()
+        # queued thumbnails aren't worth waiting for, only saves are
+        pools.get("decode").clear()
+        pools.wait()
+        self.thumbnails.flush()
+        # tabs write through the database until their threads are joined
+        self.db.stop()
     
     def registerTabs(self, tabs):
         self.tabs = tabs
@@ -220,6 +241,18 @@ class GUI(QObject):
     @pyqtSlot(str, result=bool)
     def isCached(self, file):
         return self.thumbnails.has(QUrl.fromLocalFile(file).toLocalFile(), (256,256))
+
+    @pyqtSlot(result='QVariant')
+    def thumbnailStats(self):
+        return self.thumbnails.stats()
+
+    @pyqtSlot(result='QVariant')
+    def poolStats(self):
+        return pools.stats()
+
+    @pyqtSlot(result='QVariant')
+    def databaseStats(self):
+        return self.db.stats()
     
     @pyqtProperty('QString', notify=statusUpdated)
     def statusText(self):
@@ -391,6 +424,7 @@ class GUI(QObject):
             self.addResult(id, "result", data["images"])
             self.setReady()
             self._results = {}
+            self._resultData = {}
 
         if type == "annotate":
             self.addResult(id, "result", data["images"])
@@ -414,13 +448,20 @@ class GUI(QObject):
         if not id in self._results:
             self._results[id] = {}
         self._results[id][name] = []
+        # only saved results need the encoded bytes, previews and artifacts just display
+        keep = name == "result"
+        raw = []
         for d in data:
             if type(d) == bytes or type(d) == bytearray:
                 img = QImage()
                 img.loadFromData(d, "png")
                 self._results[id][name] += [img]
+                raw += [bytes(d) if keep else None]
             else:
                 self._results[id][name] += [d]
+                raw += [None]
+        if keep:
+            self._resultData.setdefault(id, {})[name] = raw
         self.result.emit(id, name)
     
     @pyqtSlot(str, int)
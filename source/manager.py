@@ -7,29 +7,88 @@ import random
 import copy
 import re
 
-from PyQt5.QtCore import pyqtSlot, pyqtProperty, pyqtSignal, QObject, Qt, QSize, QThreadPool, QRect, QMutex, QRunnable, QRectF
+from PyQt5.QtCore import pyqtSlot, pyqtProperty, pyqtSignal, QObject, Qt, QSize, QRect, QMutex, QWaitCondition, QRunnable, QRectF
 from PyQt5.QtGui import QImage, QPainter, QColor, QFont, QFontMetrics, QTextOption
 
 import parameters
+import pools
+import thumbnails
 from misc import encodeImage
+from canvas.shared import QImagetoPILView
+from metadata import spliceText, spliceComments, makeExif
 from tabs.basic.basic_input import BasicInputRole
 
+class OutputSequencer():
+    def __init__(self):
+        self.guard = QMutex()
+        self.condition = QWaitCondition()
+        self.issued = {}
+        self.published = {}
+
+    def reserve(self, folder):
+        self.guard.lock()
+        ticket = self.issued.get(folder, 0)
+        self.issued[folder] = ticket + 1
+        self.guard.unlock()
+        return ticket
+
+    def wait(self, folder, ticket, timeout=5000):
+        # the gallery indexes files in the order they appear, so publishing follows reservation order
+        self.guard.lock()
+        while self.published.get(folder, 0) < ticket:
+            if not self.condition.wait(self.guard, timeout):
+                break
+        self.guard.unlock()
+
+    def done(self, folder, ticket):
+        self.guard.lock()
+        self.published[folder] = max(self.published.get(folder, 0), ticket + 1)
+        self.condition.wakeAll()
+        self.guard.unlock()
+
+OUTPUT_SEQUENCER = OutputSequencer()
+
+class OutputFormat():
+    EXTENSIONS = {"png": "png", "webp": "webp", "jpeg": "jpg"}
+    def __init__(self, format="png", quality=95, compression=-1, optimize=False, lossless=False):
+        self.format = format if format in OutputFormat.EXTENSIONS else "png"
+        self.extension = OutputFormat.EXTENSIONS[self.format]
+        self.quality = int(quality)
+        self.compression = int(compression)
+        self.optimize = bool(optimize)
+        self.lossless = bool(lossless)
+
+    def save(self, file, image, text, data=None):
+        if self.format == "png":
+            if data and self.compression < 0 and not self.optimize:
+                # the backend already encoded it, so only the text chunks are added
+                with open(file, "wb") as f:
+                    f.write(spliceText(data, text))
+                return
+            m = PIL.PngImagePlugin.PngInfo()
+            for key, value in text.items():
+                m.add_text(key, value)
+            options = {"compress_level": self.compression} if self.compression >= 0 else {}
+            image.save(file, format="PNG", pnginfo=m, optimize=self.optimize, **options)
+        elif self.format == "webp":
+            image.save(file, format="WEBP", lossless=self.lossless, quality=self.quality, exif=makeExif(text))
+        elif self.format == "jpeg":
+            out = io.BytesIO()
+            image.convert("RGB").save(out, format="JPEG", quality=self.quality, optimize=self.optimize, exif=makeExif(text))
+            with open(file, "wb") as f:
+                f.write(spliceComments(out.getvalue(), text))
+
 class OutputWriter(QRunnable):
-    guard = QMutex()
-    def __init__(self, img, metadata, outputs, folder, filename):
+    def __init__(self, img, metadata, outputs, folder, filename, data=None, format=None):
         super(OutputWriter, self).__init__()
         self.setAutoDelete(True)
 
-        if not OutputWriter.guard.tryLock(5000):
-            OutputWriter.guard.unlock()
-            OutputWriter.guard.lock()
-
-        m = PIL.PngImagePlugin.PngInfo()
+        text = {}
         if metadata:
-            m.add_text("parameters", parameters.formatParameters(metadata))
+            text["parameters"] = parameters.formatParameters(metadata)
             recipe = parameters.formatRecipe(metadata)
             if recipe:
-                m.add_text("recipe", recipe)
+                text["recipe"] = recipe
 
         folder = os.path.join(outputs, folder)
         os.makedirs(folder, exist_ok=True)
@@ -39,22 +98,33 @@ class OutputWriter(QRunnable):
             filename = f"{idx:08d}-" + datetime.datetime.now().strftime("%m%d%H%M")
 
         self.img = img
+        self.data = data
+        self.format = format or OutputFormat()
+        self.folder = folder
+        self.ticket = OUTPUT_SEQUENCER.reserve(folder)
         self.tmp = os.path.join(folder, f"{filename}.tmp")
-        self.file = os.path.join(folder, f"{filename}.png")
-        self.metadata = m
+        self.file = os.path.join(folder, f"{filename}.{self.format.extension}")
+        self.text = text
 
     @pyqtSlot()
     def run(self):
-        if type(self.img) == QImage:
-            self.img = encodeImage(self.img)
+        try:
+            if type(self.img) == QImage:
+                self.img = QImagetoPILView(self.img)
 
-        if type(self.img) == bytes:
-            self.img = PIL.Image.open(io.BytesIO(self.img))
+            if type(self.img) == bytes:
+                self.data = self.data or self.img
+                self.img = PIL.Image.open(io.BytesIO(self.img))
 
-        self.img.save(self.tmp, format="PNG", pnginfo=self.metadata)
-        os.replace(self.tmp, self.file)
+            self.format.save(self.tmp, self.img, self.text, self.data)
+            OUTPUT_SEQUENCER.wait(self.folder, self.ticket)
+            os.utime(self.tmp)
+            os.replace(self.tmp, self.file)
+        finally:
+            OUTPUT_SEQUENCER.done(self.folder, self.ticket)
 
-        OutputWriter.guard.unlock()
+        if thumbnails.ThumbnailStorage.instance:
+            thumbnails.ThumbnailStorage.instance.seed(self.file, self.img)
 
 class RequestManager(QObject):
     artifact = pyqtSignal(int, QImage, str)
@@ -94,6 +164,11 @@ class RequestManager(QObject):
         self.grid_metadata = None
         self.grid_save_all = False
 
+    def outputFormat(self):
+        config = self.gui.config
+        return OutputFormat(config.get("output_format"), config.get("output_quality"), config.get("output_compression"),
+                            config.get("output_optimize"), config.get("output_lossless"))
+
     def setRequests(self, requests):
         if self.parameters:
             folder = self.parameters._values.get("output_folder")
@@ -432,6 +507,7 @@ class RequestManager(QObject):
             if id in self.ids:
                 self.ids.remove(id)
             results = self.gui._results[id]["result"]
+            data = self.gui._resultData.get(id, {}).get("result", None)
             metadata = self.gui._results[id].get("metadata", None)
             artifacts = {k:v for k,v in self.gui._results[id].items() if not k in {"result", "metadata", "preview"}}
             out = self.mapping[id]
@@ -446,9 +522,9 @@ class RequestManager(QObject):
                 meta = metadata[i] if metadata else None
 
                 folder = self.folders.get(id, "monitor")
-                writer = OutputWriter(result, meta, self.gui.outputDirectory(), folder, None)
+                writer = OutputWriter(result, meta, self.gui.outputDirectory(), folder, None, data[i] if data else None, self.outputFormat())
                 file = writer.file
-                QThreadPool.globalInstance().start(writer)
+                pools.get("write").start(writer)
 
                 self.result.emit(out, result, meta, file)
 
@@ -557,15 +633,15 @@ class RequestManager(QObject):
 
             if self.grid_save_all:
                 folder = self.folders.get(self.grid_id, "grid")
-                writer = OutputWriter(image, metadata[0], self.gui.outputDirectory(), folder, None)
+                writer = OutputWriter(image, metadata[0], self.gui.outputDirectory(), folder, None, None, self.outputFormat())
                 file = writer.file
-                QThreadPool.globalInstance().start(writer)
+                pools.get("write").start(writer)
 
             if len(self.grid_ids) == cx*cy:
                 folder = self.folders.get(self.grid_id, "grid")
-                writer = OutputWriter(self.grid_image, self.grid_metadata, self.gui.outputDirectory(), folder, None)
+                writer = OutputWriter(self.grid_image, self.grid_metadata, self.gui.outputDirectory(), folder, None, None, self.outputFormat())
                 file = writer.file
-                QThreadPool.globalInstance().start(writer)
+                pools.get("write").start(writer)
                 self.result.emit(out, self.grid_image, self.grid_metadata, file)
             else:
                 if self.requests:
@@ -0,0 +1,213 @@
+import struct
+import zlib
+
+import PIL.Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+TEXT_CHUNKS = {b"tEXt", b"zTXt", b"iTXt"}
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+EXIF_IFD = 0x8769
+EXIF_USER_COMMENT = 0x9286
+EXIF_MAKER_NOTE = 0x927C
+
+def decodeText(type, data):
+    if type == b"tEXt":
+        key, value = data.split(b"\0", 1)
+        return key.decode("latin-1"), value.decode("latin-1")
+    if type == b"zTXt":
+        key, value = data.split(b"\0", 1)
+        return key.decode("latin-1"), zlib.decompress(value[1:]).decode("latin-1")
+    if type == b"iTXt":
+        key, value = data.split(b"\0", 1)
+        compressed = value[0]
+        _, _, value = value[2:].split(b"\0", 2)
+        if compressed:
+            value = zlib.decompress(value)
+        return key.decode("latin-1"), value.decode("utf-8")
+    return None, None
+
+def makeChunk(type, data):
+    return struct.pack(">I4s", len(data), type) + data + struct.pack(">I", zlib.crc32(type + data) & 0xFFFFFFFF)
+
+def encodeText(key, value):
+    try:
+        return makeChunk(b"tEXt", key.encode("latin-1") + b"\0" + value.encode("latin-1"))
+    except UnicodeError:
+        return makeChunk(b"iTXt", key.encode("latin-1") + b"\0\0\0\0\0" + value.encode("utf-8"))
+
+def spliceText(data, text):
+    # adds text chunks to already encoded PNG bytes, replacing any existing ones with the same keys
+    data = memoryview(data)
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("not a PNG")
+    keys = {key.encode("latin-1") for key in text}
+    out = [PNG_SIGNATURE]
+    pos = 8
+    while pos + 8 <= len(data):
+        length, type = struct.unpack(">I4s", data[pos:pos+8])
+        end = pos + length + 12
+        if not (type in TEXT_CHUNKS and bytes(data[pos+8:end-4]).split(b"\0", 1)[0] in keys):
+            out += [data[pos:end]]
+        if type == b"IHDR":
+            out += [encodeText(key, value) for key, value in text.items()]
+        pos = end
+    return b"".join(out)
+
+def readPNG(file):
+    # reads the header and text chunks without decoding any image data
+    width, height, text = 0, 0, {}
+    with open(file, "rb") as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError(f"not a PNG: {file}")
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, type = struct.unpack(">I4s", header)
+            if type == b"IDAT" or type == b"IEND":
+                break
+            if type == b"IHDR":
+                width, height = struct.unpack(">II", f.read(8))
+                f.seek(length - 8 + 4, 1)
+            elif type in TEXT_CHUNKS:
+                try:
+                    key, value = decodeText(type, f.read(length))
+                    if key and not key in text:
+                        text[key] = value
+                except Exception:
+                    pass
+                f.seek(4, 1)
+            else:
+                f.seek(length + 4, 1)
+    return width, height, text
+
+def makeExif(text):
+    # parameters go in UserComment where other tools look for them, the recipe in MakerNote
+    ifd = {}
+    if "parameters" in text:
+        ifd[EXIF_USER_COMMENT] = b"UNICODE\0" + text["parameters"].encode("utf-16-be")
+    if "recipe" in text:
+        ifd[EXIF_MAKER_NOTE] = text["recipe"].encode("utf-8")
+    exif = PIL.Image.Exif()
+    exif[EXIF_IFD] = ifd
+    return exif.tobytes()
+
+def decodeComment(value):
+    if type(value) == str:
+        return value
+    prefix, value = value[:8], value[8:]
+    if prefix == b"UNICODE\0":
+        try:
+            return value.decode("utf-16-be")
+        except UnicodeError:
+            return value.decode("utf-16-le")
+    return value.decode("utf-8", errors="replace").rstrip("\0")
+
+def readExif(data):
+    exif = PIL.Image.Exif()
+    exif.load(data)
+    ifd = exif.get_ifd(EXIF_IFD)
+    text = {}
+    if EXIF_USER_COMMENT in ifd:
+        text["parameters"] = decodeComment(ifd[EXIF_USER_COMMENT])
+    if EXIF_MAKER_NOTE in ifd:
+        recipe = ifd[EXIF_MAKER_NOTE]
+        text["recipe"] = recipe if type(recipe) == str else recipe.decode("utf-8", errors="replace")
+    return text
+
+def spliceComments(data, text):
+    # adds "key: value" COM segments after the APPn segments, the form Qt reads back into QImage.text
+    data = memoryview(data)
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("not a JPEG")
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF and 0xE0 <= data[pos+1] <= 0xEF:
+        pos += 2 + struct.unpack(">H", data[pos+2:pos+4])[0]
+    comments = []
+    for key, value in text.items():
+        comment = f"{key}: {value}".encode("utf-8")
+        if len(comment) <= 65533:
+            comments += [b"\xff\xfe" + struct.pack(">H", len(comment) + 2) + comment]
+    return b"".join([data[:pos]] + comments + [data[pos:]])
+
+def readJPEG(file):
+    width, height, text, exif = 0, 0, {}, {}
+    with open(file, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            raise ValueError(f"not a JPEG: {file}")
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                break
+            type = marker[1]
+            if type == 0xDA or type == 0xD9:
+                break
+            if type == 0x01 or 0xD0 <= type <= 0xD7:
+                continue
+            length = struct.unpack(">H", f.read(2))[0]
+            if type in JPEG_SOF:
+                height, width = struct.unpack(">xHH", f.read(5))
+                f.seek(length - 7, 1)
+            elif type == 0xFE:
+                comment = f.read(length - 2).decode("utf-8", errors="replace")
+                if ": " in comment:
+                    key, value = comment.split(": ", 1)
+                    if not key in text:
+                        text[key] = value
+            elif type == 0xE1:
+                data = f.read(length - 2)
+                if data.startswith(b"Exif\0\0"):
+                    try:
+                        exif = readExif(data)
+                    except Exception:
+                        pass
+            else:
+                f.seek(length - 2, 1)
+    return width, height, {**exif, **text}
+
+def readWebP(file):
+    width, height, text = 0, 0, {}
+    with open(file, "rb") as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:] != b"WEBP":
+            raise ValueError(f"not a WebP: {file}")
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            type, length = struct.unpack("<4sI", header)
+            padded = length + (length & 1)
+            if type == b"VP8X":
+                data = f.read(10)
+                width = 1 + int.from_bytes(data[4:7], "little")
+                height = 1 + int.from_bytes(data[7:10], "little")
+                f.seek(padded - 10, 1)
+            elif type == b"VP8 " and not width:
+                data = f.read(10)
+                width, height = struct.unpack("<HH", data[6:10])
+                width, height = width & 0x3FFF, height & 0x3FFF
+                f.seek(padded - 10, 1)
+            elif type == b"VP8L" and not width:
+                bits = struct.unpack("<I", f.read(5)[1:])[0]
+                width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+                f.seek(padded - 5, 1)
+            elif type == b"EXIF":
+                try:
+                    text = readExif(f.read(length))
+                except Exception:
+                    pass
+                f.seek(padded - length, 1)
+            else:
+                f.seek(padded, 1)
+    return width, height, text
+
+def readImage(file):
+    with open(file, "rb") as f:
+        header = f.read(12)
+    if header.startswith(PNG_SIGNATURE):
+        return readPNG(file)
+    if header.startswith(b"\xff\xd8"):
+        return readJPEG(file)
+    if header[:4] == b"RIFF" and header[8:] == b"WEBP":
+        return readWebP(file)
+    raise ValueError(f"unsupported image: {file}")
@@ -9,7 +9,9 @@ from typing import cast
 import PIL.Image
 import PIL.PngImagePlugin
 
-from PyQt5.QtCore import pyqtSlot, pyqtProperty, pyqtSignal, QObject, Qt, QVariant, QSize
+import metadata
+
+from PyQt5.QtCore import pyqtSlot, pyqtProperty, pyqtSignal, QObject, Qt, QVariant, QSize, QMutex
 from PyQt5.QtQml import qmlRegisterUncreatableType, qmlRegisterType
 
 IDX = -1
@@ -105,11 +107,21 @@ def parseParameters(formatted):
     
     return json
 
-def getParameters(img):
-    params = img.text("parameters")
-    if not params and img.text("Description"):
-        desc = img.text("Description").replace("(","\\(").replace(")","\\)").replace("{","(").replace("}",")")
-        data = json.loads(img.text("Comment"))
+def getParameters(img, file=None):
+    params = getTextParameters({k: img.text(k) for k in img.textKeys()})
+    if not params and file:
+        # Qt doesn't expose EXIF, so WebP and JPEG outputs are read from the file
+        try:
+            params = getTextParameters(metadata.readImage(file)[2])
+        except Exception:
+            pass
+    return params
+
+def getTextParameters(text):
+    params = text.get("parameters", "")
+    if not params and text.get("Description", ""):
+        desc = text["Description"].replace("(","\\(").replace(")","\\)").replace("{","(").replace("}",")")
+        data = json.loads(text.get("Comment", ""))
         uc = data['uc'].replace("(","\\(").replace(")","\\)").replace("{","(").replace("}",")")
         params = f"{desc}\nNegative prompt: {uc}\nSteps: {data['steps']}, Sampler: {data['sampler']}, CFG scale: {data['scale']}, Seed: {data['seed']}"
         if "strength" in data:
@@ -136,15 +148,59 @@ def formatRecipe(metadata):
     
     return json.dumps(recipe)
 
-def getIndex(folder):
-    def get_idx(filename):
+def parseIndex(filename):
+    try:
+        return int(filename.split(".")[0].split("-")[0])
+    except Exception:
+        return 0
+
+class IndexAllocator():
+    def __init__(self):
+        self.guard = QMutex()
+        self.next = {}
+
+    def allocate(self, folder, count=1):
+        # folders are scanned once, after that indices are handed out from memory
+        folder = os.path.abspath(folder)
+        self.guard.lock()
+        known = folder in self.next
+        self.guard.unlock()
+
+        # scanning happens outside the lock, another thread may get there first
+        first = 1 if known else self.scan(folder)
+
+        self.guard.lock()
+        idx = max(self.next.get(folder, first), first)
+        self.next[folder] = idx + count
+        self.guard.unlock()
+        return idx
+
+    def scan(self, folder):
+        idx = 0
         try:
-            return int(filename.split(".")[0].split("-")[0])
-        except Exception:
-            return 0
-
-    idx = max([get_idx(f) for f in os.listdir(folder)] + [0]) + 1
-    return idx
+            if os.path.isdir(folder):
+                with os.scandir(folder) as entries:
+                    idx = max([parseIndex(e.name) for e in entries] + [0])
+        except OSError:
+            pass
+        return idx + 1
+
+    def observe(self, folder, files):
+        # files added behind our back push the next index past them
+        folder = os.path.abspath(folder)
+        idx = max([parseIndex(os.path.basename(f)) for f in files] + [0]) + 1
+        self.guard.lock()
+        if folder in self.next and self.next[folder] < idx:
+            self.next[folder] = idx
+        self.guard.unlock()
+
+    def onFolderChanged(self, folder, files, *args):
+        self.observe(folder, files)
+
+INDEX_ALLOCATOR = IndexAllocator()
+
+def getIndex(folder, count=1):
+    return INDEX_ALLOCATOR.allocate(folder, count)
 
 def getExtent(bound, padding, src, wrk):
     if padding == None or padding < 0:
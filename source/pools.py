@@ -0,0 +1,107 @@
+import time
+
+from PyQt5.QtCore import QThreadPool, QThread, QMutex
+
+SIZES = {"scan": 4, "decode": 0, "write": 2, "read": 0}
+POOLS = {}
+
+class Pool(QThreadPool):
+    def __init__(self, name, size=0):
+        super().__init__(None)
+        self.name = name
+        self.guard = QMutex()
+        self.resize(size)
+
+        self.queued = 0
+        self.peak = 0
+        self.started = 0
+        self.completed = 0
+        self.taken = 0
+        self.waited = 0.0
+        self.longest = 0.0
+
+    def resize(self, size):
+        self.setMaxThreadCount(size if size > 0 else QThread.idealThreadCount())
+
+    def start(self, runnable, priority=0):
+        # the pool can't report its queue, so runnables are timed from here
+        if not hasattr(runnable, "queuedAt"):
+            run = runnable.run
+            def tracked():
+                self.begin(runnable)
+                try:
+                    run()
+                finally:
+                    self.end()
+            runnable.run = tracked
+        runnable.queuedAt = time.perf_counter()
+
+        self.guard.lock()
+        self.queued += 1
+        self.peak = max(self.peak, self.queued)
+        self.guard.unlock()
+        super().start(runnable, priority)
+
+    def tryTake(self, runnable):
+        taken = super().tryTake(runnable)
+        if taken:
+            self.guard.lock()
+            self.queued -= 1
+            self.taken += 1
+            self.guard.unlock()
+        return taken
+
+    def clear(self):
+        # queued runnables are dropped without running
+        super().clear()
+        self.guard.lock()
+        self.taken += max(self.queued, 0)
+        self.queued = 0
+        self.guard.unlock()
+
+    def begin(self, runnable):
+        wait = time.perf_counter() - runnable.queuedAt
+        self.guard.lock()
+        self.queued -= 1
+        self.started += 1
+        self.waited += wait
+        self.longest = max(self.longest, wait)
+        self.guard.unlock()
+
+    def end(self):
+        self.guard.lock()
+        self.completed += 1
+        self.guard.unlock()
+
+    def stats(self):
+        self.guard.lock()
+        out = {
+            "threads": self.maxThreadCount(), "active": self.activeThreadCount(), "queued": self.queued, "peak": self.peak,
+            "started": self.started, "completed": self.completed, "taken": self.taken,
+            "wait_avg_ms": (self.waited / self.started * 1000) if self.started else 0, "wait_max_ms": self.longest * 1000
+        }
+        self.guard.unlock()
+        return out
+
+def get(name):
+    if not name in POOLS:
+        POOLS[name] = Pool(name, SIZES.get(name, 0))
+    return POOLS[name]
+
+def threads(name):
+    # for workers that can't be a QThreadPool, like the gallery's metadata readers
+    size = SIZES.get(name, 0)
+    return size if size > 0 else QThread.idealThreadCount()
+
+def configure(sizes):
+    for name, size in sizes.items():
+        SIZES[name] = size
+        if name in POOLS:
+            POOLS[name].resize(size)
+
+def stats():
+    return {name: pool.stats() for name, pool in POOLS.items()}
+
+def wait():
+    for pool in POOLS.values():
+        pool.waitForDone()
@@ -1,5 +1,9 @@
+import bisect
+import queue
 import random
+import re
 import sys
+import threading
 from typing import *
 import time
 
@@ -7,6 +11,114 @@ from PyQt5.QtCore import pyqtProperty, pyqtSlot, pyqtSignal, Qt, QObject, QThrea
 from PyQt5.QtSql import QSqlDatabase, QSqlQuery, QSqlDriver
 from PyQt5.QtQml import qmlRegisterType
 
+def formatMatch(text):
+    # user search text to an FTS5 expression, terms are quoted so punctuation like "lora:foo" is literal
+    terms = []
+    operator = None
+    for term in re.findall(r'"[^"]*"|\S+', text):
+        if term in {"AND", "OR", "NOT"}:
+            operator = term if terms else None
+            continue
+        term = term.strip('"')
+        if term:
+            if operator:
+                terms += [operator]
+                operator = None
+            terms += ['"' + term.replace('"', '""') + '"*']
+    return " ".join(terms)
+
+def keyResults(results, seen=None):
+    # rows are identified by their first column, repeated values are told apart by occurrence
+    keys = []
+    if seen == None:
+        seen = {}
+    for record in results:
+        value = record.value(0)
+        try:
+            hash(value)
+        except TypeError:
+            value = str(value)
+        count = seen.get(value, 0)
+        seen[value] = count + 1
+        keys += [(value, count)]
+    return keys
+
+def limitQuery(query, limit, offset=0):
+    if not limit:
+        return query
+    query = query.strip().rstrip(";")
+    return f"SELECT * FROM ({query}) LIMIT {limit} OFFSET {offset};"
+
+def countQuery(query):
+    query = query.strip().rstrip(";")
+    return f"SELECT COUNT(*) FROM ({query});"
+
+def trackQuery(query):
+    # simple single table queries get the rowid appended so row changes can be matched to results
+    match = re.match(r"\s*SELECT\s+(.+?)\s+FROM\s+(\w+)\b(.*)$", query, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return None, query
+    columns, table, rest = match.groups()
+    if "(" in columns or re.match(r"DISTINCT\b", columns, re.IGNORECASE):
+        return None, query
+    if re.match(r"\s*(,|AS\b|\w+\s*,)", rest, re.IGNORECASE) or re.search(r"\b(JOIN|GROUP|HAVING|LIMIT|UNION)\b", rest, re.IGNORECASE):
+        return None, query
+    return table, f"SELECT {columns}, {table}.rowid AS _rowid FROM {table}{rest}"
+
+def shadowQuery(query, table, rowids):
+    # runs the query against only the given rows of the table
+    rowids = ",".join(str(int(r)) for r in sorted(rowids))
+    return f"WITH {table} AS (SELECT rowid AS rowid, * FROM main.{table} WHERE rowid IN ({rowids})) {query}"
+
+def rowRanges(rows):
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1][1] = row
+        else:
+            ranges += [[row, row]]
+    return ranges
+
+def diffResults(old, new):
+    # keeps the longest run of rows that are already in order, everything else is removed or inserted
+    position = {k: i for i, k in enumerate(new)}
+    survivors = [(i, position[k]) for i, k in enumerate(old) if k in position]
+
+    tails, tailIdx, previous = [], [], [-1] * len(survivors)
+    for s, (_, j) in enumerate(survivors):
+        t = bisect.bisect_left(tails, j)
+        if t > 0:
+            previous[s] = tailIdx[t-1]
+        if t == len(tails):
+            tails += [j]
+            tailIdx += [s]
+        else:
+            tails[t] = j
+            tailIdx[t] = s
+
+    kept = set()
+    s = tailIdx[-1] if tailIdx else -1
+    while s != -1:
+        kept.add(survivors[s][0])
+        s = previous[s]
+
+    removed = rowRanges([i for i in range(len(old)) if not i in kept])
+    keptNew = {position[old[i]] for i in kept}
+    inserted = rowRanges([j for j in range(len(new)) if not j in keptNew])
+
+    return removed[::-1], inserted, [(i, position[old[i]]) for i in sorted(kept)]
+
+CHANGES_LIMIT = 1000
+READ_STATEMENTS = {"SELECT", "WITH", "PRAGMA", "EXPLAIN"}
+DEFINE_STATEMENTS = {"CREATE", "DROP", "ALTER"}
+LOCKED = {"5", "6"}
+LOCK_WAITS = 1000
+WRITE_TIMEOUT = 30
+
+def statementType(query):
+    words = query.split(None, 1)
+    return words[0].upper() if words else ""
+
 class NotificationDelay(QTimer):
     notification = pyqtSignal(str)
     def __init__(self, parent, table, interval=100):
@@ -22,6 +134,7 @@ class NotificationDelay(QTimer):
 
 class Database(QObject):
     notification = pyqtSignal(str)
+    changed = pyqtSignal(str, object)
     instance = None
     def __init__(self, parent):
         super().__init__(parent)
@@ -32,6 +145,21 @@ class Database(QObject):
         Database.instance = self
 
         self.timers = {}
+        self.changes = {}
+
+        self.lockWaits = 0
+
+        self.worker = QueryWorker()
+        self.workerThread = QThread()
+        self.workerThread.started.connect(self.worker.started)
+        self.worker.moveToThread(self.workerThread)
+        self.workerThread.start()
+
+        self.writer = Writer()
+        self.writerThread = QThread()
+        self.writerThread.started.connect(self.writer.started)
+        self.writer.moveToThread(self.writerThread)
+        self.writerThread.start()
 
     @pyqtSlot(str)
     def onNotification(self, table):
@@ -41,80 +169,355 @@ class Database(QObject):
             self.timers[table] = timer
 
         if not self.timers[table].isActive():
-            self.notification.emit(table)
+            self.emitNotification(table)
             self.timers[table].start()
 
+    @pyqtSlot(str, object)
+    def onChange(self, table, rowid):
+        if not table in self.changes:
+            self.changes[table] = set()
+        self.changes[table].add(rowid)
+        self.onNotification(table)
+
     def onDelayNotification(self, table):
+        self.emitNotification(table)
+
+    def emitNotification(self, table):
+        self.changed.emit(table, self.changes.pop(table, set()))
         self.notification.emit(table)
 
+    def stats(self):
+        # lock waits of the readers, the writer counts its own
+        return {"writer": self.writer.stats(), "lock_waits": self.lockWaits}
+
+    @pyqtSlot()
+    def stop(self):
+        self.workerThread.quit()
+        self.workerThread.wait()
+        self.writer.stop()
+        self.writerThread.quit()
+        self.writerThread.wait()
+        self.writer.release()
+
 class Connection(QObject):
     notification = pyqtSignal(str)
-    def __init__(self, parent):
+    changed = pyqtSignal(str, object)
+    rowChanged = pyqtSignal(str, object)
+    def __init__(self, parent, direct=False):
         super().__init__(parent)
         self.db = None
+        self.direct = direct
 
     def connect(self):
         name = f"db_{random.randint(0, 2**32)}"
         db = QSqlDatabase.cloneDatabase("database", name)
         db.open()
-        db.driver().notification[str].connect(Database.instance.onNotification)
+        # reads never take table locks, so they can't be blocked by the writer
+        QSqlQuery("PRAGMA read_uncommitted = 1;", db)
+        db.driver().notification[str, QSqlDriver.NotificationSource, 'QVariant'].connect(self.onDriverNotification)
+        self.rowChanged.connect(Database.instance.onChange)
         Database.instance.notification.connect(self.relayNotification)
+        Database.instance.changed.connect(self.relayChanged)
 
         self.db = db
 
     def enableNotifications(self, table):
-        if not table in self.db.driver().subscribedToNotifications():
+        if not self.direct:
+            Database.instance.writer.subscribe(table, True)
+        elif not table in self.db.driver().subscribedToNotifications():
             self.db.driver().subscribeToNotification(table)
     
     def disableNotifications(self, table):
-        if table in self.db.driver().subscribedToNotifications():
+        if not self.direct:
+            Database.instance.writer.subscribe(table, False)
+        elif table in self.db.driver().subscribedToNotifications():
             self.db.driver().unsubscribeFromNotification(table)
 
-    def doQuery(self, q):
+    def doQuery(self, q, wait=False):
         if type(q) == str:
             query = QSqlQuery(self.db)
             query.prepare(q)
             q = query
-        
-        ctr = 0
+
+        # everything that writes goes through the writer, schema changes are waited on
+        kind = statementType(q.lastQuery())
+        if not self.direct and not kind in READ_STATEMENTS:
+            Database.instance.writer.submit(q.lastQuery(), q.boundValues(), False, wait or kind in DEFINE_STATEMENTS)
+            return q
+
+        waits = 0
         while not q.exec():
-            if ctr > 100:
-                print(q.lastQuery(), q.boundValues(), "TIMEOUT")
-                break
-            if q.lastError().nativeErrorCode() == "6":
-                QThread.msleep(10)
-                ctr += 1
+            if q.lastError().nativeErrorCode() in LOCKED and waits < LOCK_WAITS:
+                Database.instance.lockWaits += 1
+                waits += 1
+                QThread.msleep(1)
                 continue
-            else:
-                print(q.lastQuery(), q.boundValues(), q.lastError().text())
-                break
+            print(q.lastQuery(), q.boundValues(), q.lastError().text())
+            break
+        return q
+
+    def doBatch(self, q, wait=False):
+        if not self.direct:
+            Database.instance.writer.submit(q.lastQuery(), q.boundValues(), True, wait)
+            return q
+
+        if not q.execBatch():
+            print(q.lastQuery(), q.lastError().text())
         return q
 
+    @pyqtSlot(str, QSqlDriver.NotificationSource, 'QVariant')
+    def onDriverNotification(self, table, source, rowid):
+        # the source enum can't be queued across threads
+        self.rowChanged.emit(table, rowid)
+
     @pyqtSlot(str)
     def relayNotification(self, table):
         self.notification.emit(table)
 
+    @pyqtSlot(str, object)
+    def relayChanged(self, table, rowids):
+        self.changed.emit(table, rowids)
+
+class WriterJob():
+    def __init__(self, query, values, batch, done):
+        self.query = query
+        self.values = values
+        self.batch = batch
+        self.done = done
+
+class Writer(QObject):
+    wake = pyqtSignal()
+    def __init__(self):
+        super().__init__(None)
+        self.conn = None
+        self.jobs = queue.Queue()
+        self.prepared = {}
+        self.wake.connect(self.flush)
+        self.guard = threading.Lock()
+        self.stopped = False
+
+        self.peakDepth = 0
+        self.batches = 0
+        self.statements = 0
+        self.errors = 0
+        self.lockWaits = 0
+        self.refused = 0
+
+    @pyqtSlot()
+    def started(self):
+        self.conn = Connection(None, True)
+        self.conn.connect()
+        # REPLACE only fires delete triggers with recursive triggers enabled
+        self.conn.doQuery("PRAGMA recursive_triggers = ON;")
+
+    def submit(self, query, values, batch=False, wait=False):
+        done = threading.Event() if wait else None
+        with self.guard:
+            # the writer thread is gone once stopped, nothing would ever run the job
+            if self.stopped:
+                self.refused += 1
+                return
+            self.jobs.put(WriterJob(query, values, batch, done))
+        self.peakDepth = max(self.peakDepth, self.jobs.qsize())
+        self.wake.emit()
+        if done and not done.wait(WRITE_TIMEOUT):
+            print("SQL", "write timed out", query)
+
+    def stop(self):
+        with self.guard:
+            self.stopped = True
+
+    def release(self):
+        # jobs still queued when the thread exited are dropped, their waiters let go
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            self.refused += 1
+            if job.done:
+                job.done.set()
+
+    def subscribe(self, table, enable):
+        self.submit(None, (table, enable))
+
+    def depth(self):
+        return self.jobs.qsize()
+
+    def stats(self):
+        return {
+            "depth": self.depth(), "peak_depth": self.peakDepth, "batches": self.batches, "statements": self.statements,
+            "errors": self.errors, "lock_waits": self.lockWaits, "refused": self.refused
+        }
+
+    @pyqtSlot()
+    def flush(self):
+        jobs = []
+        while True:
+            try:
+                jobs += [self.jobs.get_nowait()]
+            except queue.Empty:
+                break
+        if not jobs:
+            return
+
+        # everything queued since the last flush is written in one transaction
+        self.conn.db.transaction()
+        for job in jobs:
+            self.execute(job)
+        self.conn.db.commit()
+        self.batches += 1
+
+        for job in jobs:
+            if job.done:
+                job.done.set()
+
+    def execute(self, job):
+        if job.query == None:
+            table, enable = job.values
+            if enable:
+                self.conn.enableNotifications(table)
+            else:
+                self.conn.disableNotifications(table)
+            return
+
+        q = self.prepared.get(job.query, None)
+        if q == None:
+            if len(self.prepared) > 64:
+                self.prepared = {}
+            q = QSqlQuery(self.conn.db)
+            q.prepare(job.query)
+            self.prepared[job.query] = q
+        if "?" in job.query:
+            for key in sorted(job.values, key=len):
+                q.addBindValue(job.values[key])
+        else:
+            for key, value in job.values.items():
+                q.bindValue(key, value)
+
+        waits = 0
+        while not (q.execBatch() if job.batch else q.exec()):
+            if q.lastError().nativeErrorCode() in LOCKED and waits < LOCK_WAITS:
+                self.lockWaits += 1
+                waits += 1
+                QThread.msleep(1)
+                continue
+            self.errors += 1
+            print(q.lastQuery(), q.lastError().text())
+            break
+        self.statements += 1
+        q.finish()
+
+class QueryWorker(QObject):
+    result = pyqtSignal(int, int, object)
+    counted = pyqtSignal(int, int, int)
+    probed = pyqtSignal(int, int, object, object)
+    def __init__(self):
+        super().__init__(None)
+        self.conn = None
+        self.latest = {}
+
+    @pyqtSlot()
+    def started(self):
+        self.conn = Connection(None)
+        self.conn.connect()
+
+    @pyqtSlot(int, int, str, int, int, object)
+    def run(self, owner, request, query, limit, offset, keys):
+        # a newer request from the same model is already queued behind this one
+        if self.latest.get(owner) != request:
+            return
+
+        q = self.conn.doQuery(limitQuery(query, limit and limit + 1, offset))
+        if q.lastError().isValid():
+            self.result.emit(owner, request, None)
+            return
+
+        results = []
+        while q.next():
+            results += [q.record()]
+        q.finish()
+
+        more = bool(limit) and len(results) > limit
+        if more:
+            results = results[:limit]
+
+        # fetches only append so they need no diff
+        seen = {}
+        newKeys, plan = None, None
+        if keys != None:
+            newKeys = keyResults(results, seen)
+            plan = diffResults(keys, newKeys)
+
+        self.result.emit(owner, request, (results, more, keys, newKeys, seen, plan))
+
+    @pyqtSlot(int, int, str, object)
+    def probe(self, owner, request, query, changes):
+        # only whether any of the changed rows match the query
+        if self.latest.get(owner) != request:
+            return
+
+        q = self.conn.doQuery(limitQuery(query, 1))
+        hit = None if q.lastError().isValid() else q.next()
+        q.finish()
+        self.probed.emit(owner, request, changes, hit)
+
+    @pyqtSlot(int, int, str)
+    def count(self, owner, request, query):
+        q = self.conn.doQuery(query)
+        total = q.value(0) if q.next() else -1
+        q.finish()
+        self.counted.emit(owner, request, total)
+
 class Sql(QAbstractListModel):
     queryChanged = pyqtSignal()
     resultsChanged = pyqtSignal()
+    totalChanged = pyqtSignal()
+    requested = pyqtSignal(int, int, str, int, int, object)
+    countRequested = pyqtSignal(int, int, str)
+    probeRequested = pyqtSignal(int, int, str, object)
+    owners = 0
     def __init__(self, parent):
         super().__init__(parent)
 
         self.results = []
+        self.keys = []
+        self.seen = {}
+        self.rowids = None
+        self.more = False
+        self._total = 0
+        self.countRequest = 0
 
         self.conn = Connection(self)
         self.conn.connect()
-        self.conn.notification.connect(self.onNotification)
+        self.conn.changed.connect(self.onChanged)
 
         self.errored = False
         self.currentQuery = ""
+        self.trackedQuery = ""
+        self.trackedTable = None
         self.fieldNames: Dict[int, QByteArray] = {}
 
+        self.changes = set()
+        self.changesOverflow = False
         self.reloadTimer = QTimer(self)
         self.reloadTimer.setSingleShot(True)
-        self.reloadTimer.timeout.connect(self.reload)
+        self.reloadTimer.timeout.connect(self.onReloadTimeout)
 
         self._debug = False
+        self._window = 0
+        self._asynchronous = False
+
+        Sql.owners += 1
+        self.owner = Sql.owners
+        self.request = 0
+        self.worker = Database.instance.worker
+        self.worker.result.connect(self.onResult)
+        self.worker.counted.connect(self.onCounted)
+        self.worker.probed.connect(self.onProbed)
+        self.requested.connect(self.worker.run)
+        self.countRequested.connect(self.worker.count)
+        self.probeRequested.connect(self.worker.probe)
 
     @pyqtProperty(bool, notify=queryChanged)
     def debug(self):
@@ -123,6 +526,22 @@ class Sql(QAbstractListModel):
     @debug.setter
     def debug(self, value):
         self._debug = value
+
+    @pyqtProperty(bool, notify=queryChanged)
+    def asynchronous(self):
+        return self._asynchronous
+
+    @asynchronous.setter
+    def asynchronous(self, value):
+        self._asynchronous = value
+
+    @pyqtProperty(int, notify=queryChanged)
+    def window(self):
+        return self._window
+
+    @window.setter
+    def window(self, value):
+        self._window = max(0, value)
         
     @pyqtProperty(str, notify=queryChanged)
     def query(self):
@@ -140,97 +559,189 @@ class Sql(QAbstractListModel):
             self.queryChanged.emit()
 
         self.currentQuery = value
+        if different:
+            self.trackedTable, self.trackedQuery = trackQuery(value)
+        self.changes = set()
+        self.changesOverflow = False
+
         if not value:
+            self.cancel()
             self.reset()
             return
 
-        q = self.conn.doQuery(self.currentQuery)
-        self.errored = q.lastError().isValid()
-        if self.errored:
+        # with a window only the rows already shown are reloaded, the rest come from fetchMore
+        limit = 0
+        if self._window:
+            limit = self._window if different else max(self._window, len(self.results))
+
+        if self._asynchronous:
+            self.submit(limit, 0, self.keys)
+            return
+
+        newResults = self.fetch(limit)
+        if newResults == None:
             self.reset()
             return
 
-        newResults = []
+        self.more = bool(limit) and len(newResults) > limit
+        if self.more:
+            newResults = newResults[:limit]
+
+        self.updateResults(newResults)
+        self.roleNames()
+
+    def fetch(self, limit, offset=0, query=None):
+        q = self.conn.doQuery(limitQuery(query or self.trackedQuery, limit and limit + 1, offset))
+        self.errored = q.lastError().isValid()
+        if self.errored:
+            return None
+
+        results = []
         while q.next():
-            newResults += [q.record()]
+            results += [q.record()]
         q.finish()
+        return results
 
-        self.updateResults(newResults)
+    def submit(self, limit, offset, keys, query=None):
+        self.request += 1
+        self.worker.latest[self.owner] = self.request
+        self.requested.emit(self.owner, self.request, query or self.trackedQuery, limit, offset, keys)
+
+    def cancel(self):
+        self.request += 1
+        self.worker.latest.pop(self.owner, None)
+
+    @pyqtSlot(int, int, object)
+    def onResult(self, owner, request, result):
+        if owner != self.owner or request != self.request:
+            return
+        self.worker.latest.pop(owner, None)
+
+        self.errored = result == None
+        if self.errored:
+            self.reset()
+            return
+
+        results, more, keys, newKeys, seen, plan = result
+        if newKeys == None:
+            self.more = more
+            self.appendResults(results)
+            return
+
+        # the plan is only valid against the rows it was computed from
+        if keys is not self.keys:
+            newKeys, seen, plan = None, None, None
+        self.more = more
+        self.updateResults(results, newKeys, seen, plan)
         self.roleNames()
-    
-    def updateResults(self, newResults):
-        def find(a, b):
-            for i, e in enumerate(a):
-                if e == b:
-                    return i
-            return -1
 
-        if newResults:
-            self.updateFieldNames(newResults[0])
-        else:
-            self.fieldNames = {}
-        
-        if len(self.results) == 0 and len(newResults) != 0:
-            self.beginInsertRows(QModelIndex(), 0, len(newResults)-1)
-            self.results = newResults
-            self.endInsertRows()
-            self.resultsChanged.emit()
+    def updateTotal(self):
+        # a windowed model only holds part of the results, the rest are counted
+        if not self.more:
+            self.setTotal(len(self.results))
             return
 
-        if len(self.results) != 0 and len(newResults) == 0:
-            self.beginRemoveRows(QModelIndex(), 0, len(self.results)-1)
-            self.results = []
-            self.endRemoveRows()
-            self.resultsChanged.emit()
+        self.countRequest += 1
+        if self._asynchronous:
+            self.countRequested.emit(self.owner, self.countRequest, countQuery(self.currentQuery))
             return
 
-        totalResults = len(newResults)
+        q = self.conn.doQuery(countQuery(self.currentQuery))
+        if q.next():
+            self.setTotal(q.value(0))
+        q.finish()
 
-        changed = False
-        i = 0
-        while newResults and i < len(self.results):
-            if self.results[i] == newResults[0]:
-                newResults.pop(0)
-                i += 1
-                continue
+    @pyqtSlot(int, int, int)
+    def onCounted(self, owner, request, total):
+        if owner != self.owner or request != self.countRequest or total < 0:
+            return
+        self.setTotal(max(total, len(self.results)))
 
-            srcIdx = find(self.results[i:], newResults[0])
-            dstIdx = find(newResults, self.results[i])
-            if srcIdx == -1 and dstIdx == -1:
-                self.beginRemoveRows(QModelIndex(), i, len(self.results)-1)
-                self.results = self.results[:i]
-                self.endRemoveRows()
-                changed = True
-                break
+    def setTotal(self, total):
+        if total != self._total:
+            self._total = total
+            self.totalChanged.emit()
+
+    @pyqtProperty(int, notify=totalChanged)
+    def total(self):
+        return self._total
+
+    @pyqtSlot()
+    def fetchNext(self):
+        self.fetchMore(QModelIndex())
+
+    def pending(self):
+        # a fetch would take over the request id and the worker would drop a reload still in flight
+        return self.owner in self.worker.latest
 
-            elif srcIdx > 0:
-                self.beginRemoveRows(QModelIndex(), i, i+srcIdx-1)
-                self.results = self.results[:i] + self.results[i+srcIdx:]
-                self.endRemoveRows()
-                changed = True
+    def canFetchMore(self, parent):
+        return self.more and not self.pending()
+
+    def fetchMore(self, parent):
+        if not self.more or self.pending():
+            return
+
+        if self._asynchronous:
+            self.submit(self._window, len(self.results), None)
+            return
         
-            if dstIdx > 0:
-                self.beginInsertRows(QModelIndex(), i, i+dstIdx-1)
-                self.results = self.results[:i] + newResults[:dstIdx] + self.results[i:]
-                self.endInsertRows()
-                changed = True
-                newResults = newResults[dstIdx:]
-                i += dstIdx
+        results = self.fetch(self._window, len(self.results))
+        if not results:
+            self.more = False
+            return
 
+        self.more = len(results) > self._window
+        if self.more:
+            results = results[:self._window]
+
+        self.appendResults(results)
+
+    def appendResults(self, results):
+        if not results:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.results), len(self.results) + len(results) - 1)
+        self.results = self.results + results
+        self.keys = self.keys + keyResults(results, self.seen)
+        self.rowids = None
+        self.endInsertRows()
+        self.resultsChanged.emit()
+        if not self.more:
+            self.setTotal(len(self.results))
+    
+    def updateResults(self, newResults, newKeys=None, seen=None, plan=None):
         if newResults:
-            self.beginInsertRows(QModelIndex(), i, i+len(newResults)-1)
-            self.results += newResults
-            self.endInsertRows()
-            changed = True
-        
-        if len(self.results) > totalResults:
-            self.beginRemoveRows(QModelIndex(), totalResults, len(self.results))
-            self.results = self.results[:totalResults]
+            self.updateFieldNames(newResults[0])
+        else:
+            self.fieldNames = {}
+
+        if plan == None:
+            seen = {}
+            newKeys = keyResults(newResults, seen)
+            plan = diffResults(self.keys, newKeys)
+        removed, inserted, kept = plan
+
+        for first, last in removed:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.results[first:last+1]
             self.endRemoveRows()
-            changed = True
 
-        if changed:
+        for first, last in inserted:
+            self.beginInsertRows(QModelIndex(), first, last)
+            self.results[first:first] = newResults[first:last+1]
+            self.endInsertRows()
+
+        changed = [j for i, j in kept if self.results[j] != newResults[j]]
+        self.results = newResults
+        self.keys = newKeys
+        self.seen = seen
+        self.rowids = None
+
+        for first, last in rowRanges(changed):
+            self.dataChanged.emit(self.index(first), self.index(last))
+
+        if removed or inserted or changed:
             self.resultsChanged.emit()
+        self.updateTotal()
 
     def data(self, index, role):
         value = QVariant()
@@ -256,6 +767,17 @@ class Sql(QAbstractListModel):
             out[record.fieldName(i)] = record.value(i)
         return out
     
+    @pyqtSlot(str, str, str, result=str)
+    def match(self, table, column, text):
+        if not text:
+            return "1"
+        if not table in self.conn.db.tables():
+            return column + " LIKE '%" + text.replace("'", "''") + "%'"
+        match = formatMatch(text).replace("'", "''")
+        if not match:
+            return "1"
+        return f"rowid IN (SELECT rowid FROM {table} WHERE {table} MATCH '{match}')"
+
     @pyqtProperty(int, notify=resultsChanged)
     def length(self):
         return len(self.results)
@@ -276,19 +798,104 @@ class Sql(QAbstractListModel):
         self.beginResetModel()
         self.fieldNames = {}
         self.results = []
+        self.keys = []
+        self.seen = {}
+        self.rowids = None
+        self.more = False
         self.endResetModel()
+        self.countRequest += 1
+        self.setTotal(0)
 
     @pyqtSlot()
     def forceReset(self):
         self.beginResetModel()
         self.endResetModel()
 
-    @pyqtSlot(str)
-    def onNotification(self, table):
+    @pyqtSlot(str, object)
+    def onChanged(self, table, rowids):
         if table in self.currentQuery:
+            # changes to the tracked table are collected so unrelated writes can be skipped
+            if table == self.trackedTable:
+                if not rowids:
+                    return
+                self.changes |= rowids
+            else:
+                self.changesOverflow = True
+            if len(self.changes) > CHANGES_LIMIT:
+                self.changesOverflow = True
+
             if not self.reloadTimer.isActive():
                 self.reloadTimer.start(random.randint(50,150))
 
+    def shownRowids(self):
+        # tracked results carry the rowid in their last column
+        if self.rowids == None:
+            self.rowids = {r.value(r.count() - 1) for r in self.results}
+        return self.rowids
+
+    @pyqtSlot()
+    def onReloadTimeout(self):
+        changes = self.changes
+        if self.changesOverflow or not changes or self.pending():
+            self.reload()
+            return
+        self.changes = set()
+
+        # skip the reload if the changed rows are neither shown nor match the query
+        if not changes & self.shownRowids():
+            query = shadowQuery(self.trackedQuery, self.trackedTable, changes)
+            if self._asynchronous:
+                self.request += 1
+                self.worker.latest[self.owner] = self.request
+                self.probeRequested.emit(self.owner, self.request, query, changes)
+                return
+
+            probe = self.fetch(1, 0, query)
+            if probe == None:
+                self.reset()
+                return
+            self.applyProbe(changes, bool(probe))
+            return
+
+        self.patch(changes)
+
+    @pyqtSlot(int, int, object, object)
+    def onProbed(self, owner, request, changes, hit):
+        if owner != self.owner or request != self.request:
+            return
+        self.worker.latest.pop(owner, None)
+
+        self.errored = hit == None
+        if self.errored:
+            self.reset()
+            return
+        self.applyProbe(changes, hit)
+
+    def applyProbe(self, changes, hit):
+        if hit:
+            self.patch(changes)
+        elif self.more:
+            # rows past the window may have been removed
+            self.updateTotal()
+
+    def patch(self, changes):
+        # only fully loaded results can be patched from the changed rows
+        if self.more:
+            self.reload()
+            return
+
+        query = shadowQuery(self.trackedQuery, self.trackedTable, self.shownRowids() | changes)
+        if self._asynchronous:
+            self.submit(0, 0, self.keys, query)
+            return
+
+        newResults = self.fetch(0, 0, query)
+        if newResults == None:
+            self.reset()
+            return
+        self.updateResults(newResults)
+        self.roleNames()
+
     @pyqtSlot()
     def reload(self):
         self.setQuery(self.currentQuery)
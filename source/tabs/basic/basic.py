@@ -8,7 +8,7 @@ from PyQt5.QtNetwork import QNetworkRequest, QNetworkReply
 import parameters
 import re
 from misc import MimeData, encodeImage
-from canvas.shared import CanvasWrapper
+from canvas.shared import CanvasWrapper, QImagetoPILView
 import sql
 import time
 import io
@@ -29,15 +29,10 @@ import PIL.PngImagePlugin
 MIME_BASIC_DIVIDER = "application/x-qd-basic-divider"
 
 class BasicImageWriter(QRunnable):
-    guard = QMutex()
     def __init__(self, img, metadata, outputs, subfolder, filename):
         super(BasicImageWriter, self).__init__()
         self.setAutoDelete(True)
 
-        if not BasicImageWriter.guard.tryLock(5000):
-            BasicImageWriter.guard.unlock()
-            BasicImageWriter.guard.lock()
-
         m = PIL.PngImagePlugin.PngInfo()
         if metadata:
             m.add_text("parameters", parameters.formatParameters(metadata))
@@ -50,22 +45,27 @@ class BasicImageWriter(QRunnable):
             filename = f"{idx:08d}-" + datetime.datetime.now().strftime("%m%d%H%M")
 
         self.img = img
+        self.folder = folder
+        self.ticket = manager.OUTPUT_SEQUENCER.reserve(folder)
         self.tmp = os.path.join(folder, f"{filename}.tmp")
         self.file = os.path.join(folder, f"{filename}.png")
         self.metadata = m
 
     @pyqtSlot()
     def run(self):
-        if type(self.img) == QImage:
-            self.img = encodeImage(self.img)
-
-        if type(self.img) == bytes:
-            self.img = PIL.Image.open(io.BytesIO(self.img))
+        try:
+            if type(self.img) == QImage:
+                self.img = QImagetoPILView(self.img)
 
-        self.img.save(self.tmp, format="PNG", pnginfo=self.metadata)
-        os.replace(self.tmp, self.file)
+            if type(self.img) == bytes:
+                self.img = PIL.Image.open(io.BytesIO(self.img))
 
-        BasicImageWriter.guard.unlock()
+            self.img.save(self.tmp, format="PNG", pnginfo=self.metadata)
+            manager.OUTPUT_SEQUENCER.wait(self.folder, self.ticket)
+            os.utime(self.tmp)
+            os.replace(self.tmp, self.file)
+        finally:
+            manager.OUTPUT_SEQUENCER.done(self.folder, self.ticket)
 
 class Basic(QObject):
     updated = pyqtSignal()
@@ -365,7 +365,7 @@ class Basic(QObject):
             if url.isLocalFile():
                 image = QImage(url.toLocalFile())
                 self.pastedImage.emit(image)
-                params = parameters.getParameters(image)
+                params = parameters.getParameters(image, url.toLocalFile())
                 if params:
                     try:
                         seed = parameters.parseParameters(params)["seed"]
@@ -561,9 +561,11 @@ class Basic(QObject):
             if url.isValid():
                 urls += [url]
 
+        file = None
         for url in urls:
             if url.isLocalFile():
-                image = QImage(url.toLocalFile())
+                file = url.toLocalFile()
+                image = QImage(file)
             elif url.scheme() == "http" or url.scheme() == "https":
                 if url.fileName().rsplit(".")[-1] in {"png", "jpg", "jpeg", "webp", "gif"}:
                     self.download(url, None)
@@ -571,7 +573,7 @@ class Basic(QObject):
 
         if image and not image.isNull():
             self.pastedImage.emit(image)
-            params = parameters.getParameters(image)
+            params = parameters.getParameters(image, file)
             if params:
                 self.pastedText.emit(params)
         
@@ -158,6 +158,7 @@ Rectangle {
             anchors.top: searchDivider.bottom
             anchors.bottom: parent.bottom
             clip: true
+            total: filesSql.total
 
             SText {
                 anchors.centerIn: parent
@@ -169,7 +170,9 @@ Rectangle {
 
             model: Sql {
                 id: filesSql
-                query: root.asleep ? "" : ("SELECT file, width, height, parameters FROM images WHERE folder = '" + folder.currentValue + "' AND parameters LIKE '%" + search.text + "%' ORDER BY idx DESC;")
+                window: 512
+                asynchronous: true
+                query: root.asleep ? "" : ("SELECT file, width, height, parameters FROM images WHERE folder = '" + folder.currentValue + "' AND " + filesSql.match("search", "parameters", search.text) + " ORDER BY idx DESC;")
                 
                 property bool reset: false
 
@@ -321,7 +324,7 @@ Rectangle {
             topPadding: 6
             bottomPadding: 2
             pointSize: 9
-            text: root.tr("%1 images").arg(gallery.count)
+            text: root.tr("%1 images").arg(filesSql.total)
         }
 
         Rectangle {
@@ -351,6 +354,61 @@ Rectangle {
             pointSize: 9
             text: gallery.selectedLength > 1 ? root.tr("%1 images selected").arg(gallery.selectedLength)  : ""
         }
+
+        Rectangle {
+            id: infoOperation
+            anchors.horizontalCenter: parent.horizontalCenter
+            anchors.bottom: parent.bottom
+            anchors.bottomMargin: -5
+            width: infoOperationText.width
+            opacity: 0.9
+            height: 25
+            visible: GALLERY.operationActive
+            color: "#e0101010"
+            border.width: 1
+            border.color: COMMON.bg3
+
+            SProgress {
+                x: 1
+                y: 1
+                width: parent.width - 2
+                height: parent.height - 2
+                working: visible
+                progress: GALLERY.operationTotal > 0 ? GALLERY.operationDone / GALLERY.operationTotal : -1
+                color: COMMON.bg4
+                clip: true
+            }
+
+            SText {
+                id: infoOperationText
+                anchors.top: parent.top
+                anchors.horizontalCenter: parent.horizontalCenter
+                verticalAlignment: Text.AlignVCenter
+                rightPadding: 8
+                leftPadding: 8
+                topPadding: 3
+                pointSize: 9
+                text: {
+                    var label = {"copy": root.tr("Copying %1 of %2"), "move": root.tr("Moving %1 of %2"), "delete": root.tr("Deleting %1 of %2")}[GALLERY.operationKind]
+                    return label ? label.arg(GALLERY.operationDone).arg(GALLERY.operationTotal) : ""
+                }
+            }
+
+            MouseArea {
+                id: infoOperationMouse
+                anchors.fill: parent
+                hoverEnabled: true
+                onPressed: {
+                    GALLERY.cancelOperations()
+                }
+            }
+
+            SToolTip {
+                visible: infoOperationMouse.containsMouse
+                delay: 100
+                text: root.tr("Click to cancel")
+            }
+        }
     }
 
     Item {
@@ -12,6 +12,7 @@ Item {
     property string source
     property bool selected
     property bool multiSelected
+    property bool prefetch: false
     property int padding
     property int border: selected || multiSelected ? 2 : 0
 
@@ -47,7 +48,7 @@ Item {
         anchors.leftMargin: thumb.padding
         anchors.topMargin: thumb.padding
 
-        source: (GUI.isCached(thumb.source) ? "image://sync/" : "image://async/") + thumb.source
+        source: (GUI.isCached(thumb.source) ? "image://sync/" : (thumb.prefetch ? "image://prefetch/" : "image://async/")) + thumb.source
         fillMode: Image.PreserveAspectFit
         cache: false
     }
@@ -16,6 +16,8 @@ GridView {
     property int cellSize: 200
     property int padding: 10
     property int fixedIndex: -1
+    property int total: count
+    property int columns: Math.max(Math.round(thumbView.width/thumbView.cellWidth), 1)
     cellWidth: Math.max((thumbView.width-padding)/Math.max(Math.ceil(thumbView.width/cellSize), 1), 50)
     cellHeight: cellWidth
     
@@ -176,7 +178,7 @@ GridView {
 
     ScrollBar.vertical: SScrollBarV {
         id: scrollBar
-        stepSize: 1/Math.ceil(thumbView.count / Math.round(thumbView.width/thumbView.cellWidth))
+        stepSize: 1/Math.ceil(thumbView.total / thumbView.columns)
         policy: thumbView.contentHeight > thumbView.height ? ScrollBar.AlwaysOn : ScrollBar.AlwaysOff
     }
 
@@ -192,9 +194,30 @@ GridView {
         }
     }
 
+    // rows that aren't loaded yet still take up space, so the scrollbar covers the whole folder
     footer: Item {
         width: 10
-        height: 10
+        height: 10 + Math.ceil(Math.max(0, thumbView.total - thumbView.count) / thumbView.columns) * thumbView.cellHeight
+    }
+
+    // keeps fetching windows until the loaded rows reach the bottom of the view, like after dragging the scrollbar
+    function fill() {
+        if(count < total && contentY + height > Math.ceil(count / columns) * cellHeight && model.fetchNext) {
+            model.fetchNext()
+        }
+    }
+
+    onContentYChanged: fill()
+    onCountChanged: fill()
+    onTotalChanged: fill()
+    onHeightChanged: fill()
+
+    Connections {
+        target: thumbView.model
+        ignoreUnknownSignals: true
+        function onResultsChanged() {
+            thumbView.fill()
+        }
     }
 
     delegate: Thumbnail {
@@ -202,6 +225,7 @@ GridView {
         width: cellWidth
         height: cellHeight
         padding: thumbView.padding
+        prefetch: y + height < thumbView.contentY || y > thumbView.contentY + thumbView.height
         
         property int sourceWidth: sql_width
         property int sourceHeight: sql_height
@@ -1,19 +1,188 @@
-import PIL.Image
 import shutil
 import os
 import send2trash
 import glob
+import concurrent.futures
 
 from PyQt5.QtCore import pyqtSlot, pyqtSignal, pyqtProperty, QObject, QThread, QUrl, QMimeData, Qt
-from PyQt5.QtSql import QSqlQuery
+from PyQt5.QtSql import QSqlQuery, QSqlDatabase
 from PyQt5.QtQml import qmlRegisterSingletonType
 from PyQt5.QtGui import QDesktopServices
 from PyQt5.QtWidgets import QApplication
 import sql
 import filesystem
 import parameters
+import metadata
+import thumbnails
+import pools
 import time
 
+EXTENSIONS = {"png", "webp", "jpg", "jpeg"}
+
+def splitParameters(p):
+    # SQL expressions splitting formatted parameters into prompt, negative prompt and the settings line
+    n = f"instr({p}, char(10) || 'Negative prompt:')"
+    s = f"instr({p}, char(10) || 'Steps:')"
+    prompt = f"CASE WHEN {n} > 0 THEN substr({p}, 1, {n} - 1) WHEN {s} > 0 THEN substr({p}, 1, {s} - 1) ELSE {p} END"
+    negative = f"CASE WHEN {n} > 0 THEN substr({p}, {n} + 17, CASE WHEN {s} > {n} THEN {s} - {n} - 17 ELSE length({p}) END) ELSE '' END"
+    settings = f"CASE WHEN {s} > 0 THEN substr({p}, {s} + 1) ELSE '' END"
+    return prompt, negative, settings
+
+# parsed from the parameters at index time, (column, type, conversion)
+FIELDS = [
+    ("seed", "INTEGER", int),
+    ("steps", "INTEGER", int),
+    ("sampler", "TEXT", str),
+    ("scale", "REAL", float),
+    ("model", "TEXT", str),
+    ("size", "TEXT", str),
+    ("hr_resize", "TEXT", str),
+    ("hr_factor", "REAL", float),
+    ("hr_strength", "REAL", float),
+    ("hr_upscaler", "TEXT", str),
+    ("hr_sampler", "TEXT", str),
+    ("hr_steps", "INTEGER", int)
+]
+FIELD_NAMES = [f for f, _, _ in FIELDS]
+INDEXED_FIELDS = ["seed", "steps", "sampler", "scale", "model"]
+
+INDEX_VERSION = 1
+OPERATION_CHUNK = 64
+
+def parseFields(p):
+    try:
+        parsed = parameters.parseParameters(p) if p else {}
+    except Exception:
+        parsed = {}
+    fields = []
+    for name, _, convert in FIELDS:
+        try:
+            fields += [convert(parsed[name])]
+        except Exception:
+            fields += [None]
+    return tuple(fields)
+
+def readImage(file):
+    try:
+        w, h, text = metadata.readImage(file)
+    except Exception:
+        return None
+    try:
+        p = parameters.getTextParameters(text)
+    except Exception:
+        p = text.get("parameters", "")
+    return (w, h, p) + parseFields(p)
+
+class GalleryIndex():
+    def __init__(self, file):
+        self.db = QSqlDatabase.addDatabase("QSQLITE", "gallery_index")
+        self.db.setDatabaseName(file)
+        if not self.db.open():
+            print("INDEX", file, self.db.lastError().text())
+            self.db = None
+            return
+
+        self.columns = ["width", "height", "parameters"] + FIELD_NAMES
+
+        q = self.doQuery("PRAGMA user_version;")
+        if q.next() and q.value(0) != INDEX_VERSION:
+            self.doQuery("DROP TABLE IF EXISTS entries;")
+        q.finish()
+
+        columns = ", ".join(f"{n} {t}" for n, t, _ in FIELDS)
+        for query in [
+            "PRAGMA journal_mode=WAL;",
+            "PRAGMA synchronous=NORMAL;",
+            f"CREATE TABLE IF NOT EXISTS entries(file TEXT PRIMARY KEY, folder TEXT, mtime INTEGER, filesize INTEGER, width INTEGER, height INTEGER, parameters TEXT, {columns});",
+            "CREATE INDEX IF NOT EXISTS entries_folder ON entries(folder);",
+            f"PRAGMA user_version = {INDEX_VERSION};"
+        ]:
+            self.doQuery(query)
+
+    def doQuery(self, q):
+        if type(q) == str:
+            query = QSqlQuery(self.db)
+            query.prepare(q)
+            q = query
+        if not q.exec():
+            print(q.lastQuery(), q.lastError().text())
+        return q
+
+    def lookup(self, files):
+        found = {}
+        if not self.db or not files:
+            return found
+
+        q = QSqlQuery(self.db)
+        q.prepare(f"SELECT file, mtime, filesize, {', '.join(self.columns)} FROM entries WHERE file IN ({', '.join(['?']*len(files))});")
+        for f in files:
+            q.addBindValue(f)
+        self.doQuery(q)
+        while q.next():
+            values = tuple(None if q.isNull(i) else q.value(i) for i in range(3, 3 + len(self.columns)))
+            found[q.value(0)] = (q.value(1), q.value(2), values)
+        return found
+
+    def store(self, entries):
+        if not self.db or not entries:
+            return
+
+        columns = ["file", "folder", "mtime", "filesize"] + self.columns
+
+        self.db.transaction()
+        q = QSqlQuery(self.db)
+        q.prepare(f"INSERT OR REPLACE INTO entries({', '.join(columns)}) VALUES ({', '.join(['?']*len(columns))});")
+        for i in range(len(columns)):
+            q.addBindValue([e[i] for e in entries])
+        if not q.execBatch():
+            print(q.lastQuery(), q.lastError().text())
+        self.db.commit()
+
+    def transfer(self, sources, files, folder, stats):
+        # entries follow copied or moved files, so rescans don't read them again
+        if not self.db or not files:
+            return
+
+        self.db.transaction()
+        q = QSqlQuery(self.db)
+        q.prepare(f"INSERT OR REPLACE INTO entries(file, folder, mtime, filesize, {', '.join(self.columns)}) SELECT ?, ?, ?, ?, {', '.join(self.columns)} FROM entries WHERE file = ?;")
+        q.addBindValue(files)
+        q.addBindValue([folder] * len(files))
+        q.addBindValue([s[0] for s in stats])
+        q.addBindValue([s[1] for s in stats])
+        q.addBindValue(sources)
+        if not q.execBatch():
+            print(q.lastQuery(), q.lastError().text())
+        self.db.commit()
+
+    def prune(self, folder, files):
+        if not self.db:
+            return
+
+        q = QSqlQuery(self.db)
+        q.prepare("SELECT file FROM entries WHERE folder = ?;")
+        q.addBindValue(folder)
+        self.doQuery(q)
+
+        stale = []
+        while q.next():
+            if not q.value(0) in files:
+                stale += [q.value(0)]
+        q.finish()
+
+        self.remove(stale)
+
+    def remove(self, files):
+        if not self.db or not files:
+            return
+
+        self.db.transaction()
+        q = QSqlQuery(self.db)
+        q.prepare("DELETE FROM entries WHERE file = ?;")
+        q.addBindValue(files)
+        q.execBatch()
+        self.db.commit()
+
 class Populater(QObject):
     forceReload = pyqtSignal(str)
     stop = pyqtSignal(str)
@@ -41,21 +210,55 @@ class Populater(QObject):
         self.fresh = set()
         self.initial = True
 
+        self.index = None
+        self.seen = {}
+
+        self.readers = None
+
     @pyqtSlot()
     def started(self):
         self.conn = sql.Connection(self)
         self.conn.connect()
         self.conn.doQuery("CREATE TABLE folders(folder TEXT UNIQUE, name TEXT UNIQUE, idx INTEGER UNIQUE);")
-        self.conn.doQuery("CREATE TABLE images(file TEXT UNIQUE, folder TEXT, parameters TEXT, idx INTEGER, width INTEGER, height INTEGER, CONSTRAINT unq UNIQUE (folder, idx));")
+        columns = ", ".join(f"{n} {t}" for n, t, _ in FIELDS)
+        self.conn.doQuery(f"CREATE TABLE images(file TEXT UNIQUE, folder TEXT, parameters TEXT, idx INTEGER, width INTEGER, height INTEGER, {columns}, CONSTRAINT unq UNIQUE (folder, idx));")
+        for field in INDEXED_FIELDS:
+            self.conn.doQuery(f"CREATE INDEX images_{field} ON images(folder, {field});")
+        self.createSearch()
         self.conn.enableNotifications("folders")
         self.conn.disableNotifications("images")
 
+        self.readers = concurrent.futures.ThreadPoolExecutor(max_workers=pools.threads("read"))
+
+        if self.gui.config.get("gallery_index"):
+            self.index = GalleryIndex(os.path.abspath(self.output).rstrip(os.path.sep) + ".db")
+
         self.prepareFolders()
 
+        self.watcher.started.connect(self.onStarted)
         self.watcher.finished.connect(self.onFinished)
         self.watcher.folder_changed.connect(self.onResult)
+        self.watcher.folder_diff.connect(self.onDiff)
         self.watcher.parent_changed.connect(self.onParentChanged)
 
+    def createSearch(self):
+        self.conn.doQuery("CREATE VIRTUAL TABLE search USING fts5(prompt, negative_prompt, settings);")
+        if not "search" in self.conn.db.tables():
+            return
+
+        prompt, negative, settings = splitParameters("new.parameters")
+        insert = f"INSERT INTO search(rowid, prompt, negative_prompt, settings) VALUES (new.rowid, {prompt}, {negative}, {settings});"
+        delete = "DELETE FROM search WHERE rowid = old.rowid;"
+        self.conn.doQuery(f"CREATE TRIGGER search_insert AFTER INSERT ON images BEGIN {insert} END;")
+        self.conn.doQuery(f"CREATE TRIGGER search_delete AFTER DELETE ON images BEGIN {delete} END;")
+        self.conn.doQuery(f"CREATE TRIGGER search_update AFTER UPDATE OF parameters ON images BEGIN {delete} {insert} END;")
+
+    def stop(self):
+        # called once the thread is joined, nothing is reading anymore
+        if self.readers:
+            self.readers.shutdown()
+            self.readers = None
+
     def prepareFolders(self):
         subfolders = [s.rsplit(os.path.sep,1)[-1] for s in list(filter(os.path.isdir, glob.glob(self.output + "/*")))]
         subfolders = [o for o in self.order if o in subfolders] + [s for s in subfolders if not s in self.order]
@@ -69,7 +272,7 @@ class Populater(QObject):
             
             if idx == 0:
                 self.primary = folder
-                self.watcher.watchFolder(self.primary)
+                self.watcher.watchFolder(self.primary, EXTENSIONS)
             else:
                 self.remaining += [folder]
 
@@ -89,7 +292,7 @@ class Populater(QObject):
 
     def resumeFolders(self):
         for subfolder in self.remaining:
-            self.watcher.watchFolder(subfolder)
+            self.watcher.watchFolder(subfolder, EXTENSIONS)
         self.primary = ""
         self.remaining = []
 
@@ -98,6 +301,10 @@ class Populater(QObject):
         if folder == self.output:
             self.prepareFolders()
 
+    @pyqtSlot(str)
+    def onStarted(self, folder):
+        self.seen.pop(folder, None)
+
     @pyqtSlot(str, int)
     def onFinished(self, folder, total):
         if not folder in self.folders:
@@ -109,6 +316,9 @@ class Populater(QObject):
         q.bindValue(":total", total)
         self.conn.doQuery(q)
 
+        if self.index:
+            self.index.prune(folder, self.seen.pop(folder, set()))
+
         self.working.discard(folder)
         self.fresh.discard(folder)
         if len(self.working) == 0 and len(self.fresh) == 0:
@@ -119,8 +329,8 @@ class Populater(QObject):
             self.initial = False
             self.resumeFolders()
 
-    @pyqtSlot(str, list, list)
-    def onResult(self, folder, files, idxs):
+    @pyqtSlot(str, list, list, list)
+    def onResult(self, folder, files, idxs, stats):
         if not folder in self.folders:
             return
         
@@ -128,60 +338,194 @@ class Populater(QObject):
             self.gui.setTabWorking(self.name, True)
         self.working.add(folder)
 
-        data = zip(files, idxs)
+        if self.index:
+            self.seen.setdefault(folder, set()).update(files)
+
+        self.insertFiles(folder, files, idxs, stats)
+
+    @pyqtSlot(str, list, list, list, list)
+    def onDiff(self, folder, files, idxs, stats, removed):
+        if not folder in self.folders:
+            return
+
+        inserted = self.insertFiles(folder, files, idxs, stats)
+        self.removeFiles(removed + [f for f in files if not f in inserted])
+
+    @pyqtSlot(str, list, list, list, list, bool)
+    def onTransferred(self, folder, sources, files, idxs, stats, move):
+        if idxs and folder in self.folders:
+            q = QSqlQuery(self.conn.db)
+            q.prepare(f"SELECT file FROM images WHERE file IN ({', '.join(['?']*len(sources))});")
+            for f in sources:
+                q.addBindValue(f)
+            self.conn.doQuery(q)
+            known = set()
+            while q.next():
+                known.add(q.value(0))
+            q.finish()
+
+            # rows are copied from the source rows, anything not indexed yet is read like a new file
+            copied = [i for i, f in enumerate(sources) if f in known]
+            columns = ["parameters", "width", "height"] + FIELD_NAMES
+            q = QSqlQuery(self.conn.db)
+            q.prepare(f"INSERT OR REPLACE INTO images(file, folder, idx, {', '.join(columns)}) SELECT :file, :folder, :idx, {', '.join(columns)} FROM images WHERE file == :source;")
+            q.bindValue(":file", [files[i] for i in copied])
+            q.bindValue(":folder", [folder] * len(copied))
+            q.bindValue(":idx", [idxs[i] for i in copied])
+            q.bindValue(":source", [sources[i] for i in copied])
+            self.conn.doBatch(q, True)
+
+            if self.index:
+                self.index.transfer([sources[i] for i in copied], [files[i] for i in copied], folder, [stats[i] for i in copied])
+
+            missing = [i for i, f in enumerate(sources) if not f in known]
+            if missing:
+                self.insertFiles(folder, [files[i] for i in missing], [idxs[i] for i in missing], [stats[i] for i in missing])
+
+        if move:
+            self.removeFiles(sources)
+
+    @pyqtSlot(list)
+    def onRemoved(self, files):
+        self.removeFiles(files)
+
+    def removeFiles(self, files):
+        if not files:
+            return
+
+        q = QSqlQuery(self.conn.db)
+        q.prepare("DELETE FROM images WHERE file == :file;")
+        q.bindValue(":file", files)
+        self.conn.doBatch(q)
+
+        if self.index:
+            self.index.remove(files)
+
+    def insertFiles(self, folder, files, idxs, stats):
+        data = list(zip(files, idxs, stats))
+
+        cached = {}
+        if self.index:
+            cached = self.index.lookup(files)
+        entries = []
+
+        found = {}
+        for f, _, (mtime, size) in data:
+            entry = cached.get(f, None)
+            if entry and entry[0] == mtime and entry[1] == size:
+                found[f] = entry[2]
+        missing = [f for f, _, _ in data if not f in found]
+        read = dict(zip(missing, self.readers.map(readImage, missing)))
         
-        files, folders, idxs, widths, heights, parameters = [], [], [], [], [], []
-        for f, i in data:
-            if not f.split(".")[-1] in {"png"}:
-                continue
-            w, h, p = 0, 0, ""
-            try:
-                with PIL.Image.open(f) as img:
-                    if "parameters" in img.info:
-                        p = img.info["parameters"]
-                    w, h = img.size
-            except Exception:
+        rows = []
+        for f, i, (mtime, size) in data:
+            result = read[f] if f in read else found[f]
+            if not result:
                 continue
+            if self.index and f in read:
+                entries += [(f, folder, mtime, size) + result]
+            w, h, p = result[:3]
             if w == 0 or h == 0:
                 continue
-            files += [f]
-            folders += [folder]
-            idxs += [i]
-            widths += [w]
-            heights += [h]
-            parameters += [p.replace("'", "''")]
+            rows += [(f, folder, p.replace("'", "''"), i, w, h) + result[3:]]
 
+        columns = ["file", "folder", "parameters", "idx", "width", "height"] + FIELD_NAMES
         q = QSqlQuery(self.conn.db)
-        q.prepare(f"INSERT OR REPLACE INTO images(file, folder, parameters, idx, width, height) VALUES (:file, :folder, :param, :idx, :width, :height);")
-        q.bindValue(":file", files)
-        q.bindValue(":folder", folders)
-        q.bindValue(":param", parameters)
-        q.bindValue(":idx", idxs)
-        q.bindValue(":width", widths)
-        q.bindValue(":height", heights)
-        q.execBatch()
+        q.prepare(f"INSERT OR REPLACE INTO images({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)});")
+        for c, column in enumerate(columns):
+            q.bindValue(":" + column, [r[c] for r in rows])
+        # waited on so forced reloads see the rows
+        self.conn.doBatch(q, True)
+
+        if self.index:
+            self.index.store(entries)
 
         if self.initial:
             self.forceReload.emit(folder)
 
-class Deleter(QThread):
-    def __init__(self, gui, files):
+        return set(r[0] for r in rows)
+
+class FileOperations(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int)
+    transferred = pyqtSignal(str, list, list, list, bool)
+    deleted = pyqtSignal(list)
+    def __init__(self):
         super().__init__()
-        self.files = files
-        self.gui = gui
-    def run(self):
+        self.cancelled = set()
+
+    def cancel(self, jobs):
+        # called from the GUI thread while a job is running
+        self.cancelled.update(jobs)
+
+    @pyqtSlot(int, str, str, list)
+    def run(self, job, kind, folder, files):
+        done = 0
+        for i in range(0, len(files), OPERATION_CHUNK):
+            if job in self.cancelled:
+                break
+            chunk = files[i:i+OPERATION_CHUNK]
+            if kind == "delete":
+                done = self.delete(job, chunk, done)
+            else:
+                done = self.transfer(job, kind == "move", folder, chunk, done)
+        self.cancelled.discard(job)
+        self.finished.emit(job)
+
+    def transfer(self, job, move, folder, files, done):
+        moved = []
+        for src in files:
+            if job in self.cancelled:
+                break
+            ext = os.path.splitext(src)[1]
+            dst = os.path.abspath(os.path.join(folder, f"{parameters.getIndex(folder):07d}{ext}"))
+            while os.path.exists(dst):
+                dst = os.path.abspath(os.path.join(folder, f"{parameters.getIndex(folder):07d}{ext}"))
+            stamp = thumbnails.file_stamp(src)
+            try:
+                if move:
+                    shutil.move(src, dst)
+                else:
+                    shutil.copy(src, dst)
+            except OSError:
+                continue
+            moved += [(src, stamp, dst, thumbnails.file_stamp(dst))]
+            done += 1
+            self.progress.emit(job, done)
+
+        moved = [m for m in moved if m[3]]
+        if moved:
+            if thumbnails.ThumbnailStorage.instance:
+                thumbnails.ThumbnailStorage.instance.transfer(moved, move)
+            self.transferred.emit(folder, [m[0] for m in moved], [m[2] for m in moved], [m[3] for m in moved], move)
+        return done
+
+    def delete(self, job, files, done):
         try:
-            send2trash.send2trash(self.files)
+            send2trash.send2trash(files)
         except OSError:
-            for f in self.files:
-                os.remove(f)
-        self.gui.thumbnails.removeAll(self.files)
+            for f in files:
+                try:
+                    os.remove(f)
+                except OSError:
+                    pass
+        if thumbnails.ThumbnailStorage.instance:
+            thumbnails.ThumbnailStorage.instance.removeAll(files)
+        self.deleted.emit(files)
+        done += len(files)
+        self.progress.emit(job, done)
+        return done
 
 class Gallery(QObject):
     update = pyqtSignal()
 
     forceReload = pyqtSignal()
 
+    transferFiles = pyqtSignal(str, list, list, list, list, bool)
+    removeFiles = pyqtSignal(list)
+    submitOperation = pyqtSignal(int, str, str, list)
+    operationUpdated = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.gui = parent
@@ -202,9 +546,24 @@ class Gallery(QObject):
         self.populater.moveToThread(self.populaterThread)
         self.populaterThread.start()
 
-        parent.aboutToQuit.connect(self.stop)
+        self.transferFiles.connect(self.populater.onTransferred)
+        self.removeFiles.connect(self.populater.onRemoved)
+
+        self.operations = FileOperations()
+        self.operations.progress.connect(self.onOperationProgress)
+        self.operations.finished.connect(self.onOperationFinished)
+        self.operations.transferred.connect(self.onTransferred)
+        self.operations.deleted.connect(self.onDeleted)
+        self.submitOperation.connect(self.operations.run)
+
+        self.operationsThread = QThread()
+        self.operations.moveToThread(self.operationsThread)
+        self.operationsThread.start()
 
-        self.deleters = []
+        self.jobs = {}
+        self.jobCount = 0
+
+        parent.aboutToQuit.connect(self.stop)
     
     @pyqtSlot(list)
     def doOpenFiles(self, files):
@@ -216,25 +575,74 @@ class Gallery(QObject):
 
     @pyqtSlot(str, list)
     def doCopy(self, folder, files):
-        idx = parameters.getIndex(folder)
-        for src in files:
-            dst = os.path.join(folder, f"{idx:07d}.png")
-            shutil.copy(src, dst)
-            idx += 1
+        self.queueOperation("copy", folder, files)
 
     @pyqtSlot(str, list)
     def doMove(self, folder, files):
-        idx = parameters.getIndex(folder)
-        for src in files:
-            dst = os.path.join(folder, f"{idx:07d}.png")
-            shutil.move(src, dst)
-            idx += 1
+        self.queueOperation("move", folder, files)
 
     @pyqtSlot(list)
     def doDelete(self, files):
-        deleter = Deleter(self.gui, files)
-        deleter.start()
-        self.deleters += [deleter]
+        self.queueOperation("delete", "", files)
+
+    def queueOperation(self, kind, folder, files):
+        if not files:
+            return
+        # files always come from the current folder, neither folder is rescanned until the job is done
+        folders = set(f for f in [folder, self.folder] if f)
+        for f in folders:
+            self.gui.watcher.hold(f)
+        self.jobCount += 1
+        self.jobs[self.jobCount] = (kind, 0, len(files), folders)
+        self.submitOperation.emit(self.jobCount, kind, folder, files)
+        self.operationUpdated.emit()
+
+    @pyqtSlot(int, int)
+    def onOperationProgress(self, job, done):
+        if job in self.jobs:
+            kind, _, total, folders = self.jobs[job]
+            self.jobs[job] = (kind, done, total, folders)
+            self.operationUpdated.emit()
+
+    @pyqtSlot(int)
+    def onOperationFinished(self, job):
+        if job in self.jobs:
+            for f in self.jobs.pop(job)[3]:
+                self.gui.watcher.release(f)
+        self.operationUpdated.emit()
+
+    @pyqtSlot()
+    def cancelOperations(self):
+        self.operations.cancel(list(self.jobs.keys()))
+
+    @pyqtSlot(str, list, list, list, bool)
+    def onTransferred(self, folder, sources, files, stats, move):
+        # the watcher is told about the files first, so the rescan their changes cause finds nothing new
+        if move:
+            self.gui.watcher.forget(sources)
+        idxs = self.gui.watcher.adopt(folder, files, stats)
+        self.transferFiles.emit(folder, sources, files, idxs, stats, move)
+
+    @pyqtSlot(list)
+    def onDeleted(self, files):
+        self.gui.watcher.forget(files)
+        self.removeFiles.emit(files)
+
+    @pyqtProperty(bool, notify=operationUpdated)
+    def operationActive(self):
+        return len(self.jobs) > 0
+
+    @pyqtProperty(str, notify=operationUpdated)
+    def operationKind(self):
+        return self.jobs[min(self.jobs)][0] if self.jobs else ""
+
+    @pyqtProperty(int, notify=operationUpdated)
+    def operationDone(self):
+        return sum(j[1] for j in self.jobs.values())
+
+    @pyqtProperty(int, notify=operationUpdated)
+    def operationTotal(self):
+        return sum(j[2] for j in self.jobs.values())
 
     @pyqtSlot(list)
     def doClipboard(self, files):
@@ -246,8 +654,12 @@ class Gallery(QObject):
 
     @pyqtSlot()
     def stop(self):
+        self.cancelOperations()
+        self.operationsThread.quit()
+        self.operationsThread.wait()
         self.populaterThread.quit()
         self.populaterThread.wait()
+        self.populater.stop()
 
     @pyqtProperty(int, notify=update)
     def cellSize(self):
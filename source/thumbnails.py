@@ -1,7 +1,9 @@
-import io
 import os
+import time
+import hashlib
+import collections
 
-from PyQt5.QtCore import pyqtSlot, pyqtSignal, QObject, QMutex, QRunnable, QThreadPool, QUrl, QByteArray, QThread, QSize
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, QObject, QMutex, QRunnable, QUrl, QByteArray, QThread, QSize, QBuffer, QIODevice
 from PyQt5.QtSql import QSqlQuery
 from PyQt5.QtQuick import QQuickImageProvider, QQuickAsyncImageProvider, QQuickImageResponse, QQuickTextureFactory
 from PyQt5.QtGui import QImage
@@ -9,110 +11,474 @@ from PyQt5.QtGui import QImage
 import PIL.Image
 
 import filesystem
+import pools
 import sql
 
-def get_thumbnail(file, size, quality):
-    blob = io.BytesIO()
-    image = PIL.Image.open(file).convert('RGB')
-    image.thumbnail(size, PIL.Image.ANTIALIAS)
-    image.save(blob, "JPEG", quality=quality)
-    return blob.getvalue()
+SMALL_THUMBNAIL = 256
+PREFETCH_PENALTY = 1 << 20
+TOUCH_INTERVAL = 30
+
+def make_thumbnail(image, size):
+    image = image.convert('RGB')
+    resample = PIL.Image.BILINEAR if max(size) <= SMALL_THUMBNAIL else PIL.Image.LANCZOS
+    image.thumbnail(size, resample, reducing_gap=2.0)
+    data = image.tobytes("raw", "RGB")
+    return QImage(data, image.width, image.height, image.width * 3, QImage.Format_RGB888).copy()
+
+def get_thumbnail(file, size):
+    with PIL.Image.open(file) as image:
+        # JPEG sources decode straight at a reduced scale
+        image.draft("RGB", size)
+        return make_thumbnail(image, size)
+
+def file_stamp(file):
+    try:
+        stat = os.stat(file)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def encode_thumbnail(image, quality):
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "JPG", quality)
+    return bytes(data)
+
+def decode_thumbnail(blob):
+    return QImage.fromData(QByteArray(blob), "JPG")
+
+class ThumbnailDiskCache():
+    def __init__(self, folder, limit):
+        self.folder = folder
+        self.limit = limit
+        self.guard = QMutex()
+        self.entries = collections.OrderedDict()
+        self.total = 0
+        self.touched = collections.OrderedDict()
+        self.lastTouch = time.monotonic()
+        self.loader = ThumbnailIndexRunnable(self)
+        pools.get("scan").start(self.loader)
+
+    def load(self):
+        # least recently used first, recency is kept in the file mtimes
+        found = []
+        try:
+            for shard in os.scandir(self.folder) if os.path.isdir(self.folder) else []:
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(".tmp"):
+                        continue
+                    stat = entry.stat()
+                    found += [(stat.st_mtime_ns, entry.name, stat.st_size)]
+        except OSError:
+            pass
+
+        # entries written while loading are the most recent ones
+        self.guard.lock()
+        entries = collections.OrderedDict()
+        for _, name, size in sorted(found):
+            if not name in self.entries:
+                entries[name] = size
+                self.total += size
+        entries.update(self.entries)
+        self.entries = entries
+        self.guard.unlock()
+
+    def key(self, file, size, stamp):
+        if stamp == None:
+            return None
+        fingerprint = f"{filesystem.canonical(file)}|{stamp[0]}|{stamp[1]}|{size[0]}x{size[1]}"
+        return hashlib.sha1(fingerprint.encode("utf-8")).hexdigest() + ".jpg"
+
+    def path(self, key):
+        return os.path.join(self.folder, key[:2], key)
+
+    def has(self, key):
+        self.guard.lock()
+        out = key in self.entries
+        self.guard.unlock()
+        return out
+
+    def get(self, key):
+        if not self.has(key):
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                blob = f.read()
+        except OSError:
+            self.discard(key)
+            return None
+        self.guard.lock()
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.touched[key] = None
+            self.touched.move_to_end(key)
+        flush = time.monotonic() - self.lastTouch > TOUCH_INTERVAL
+        self.guard.unlock()
+        if flush:
+            self.flush()
+        return blob
+
+    def flush(self):
+        # recency is written back to the file mtimes in batches, oldest first so the order survives a restart
+        self.guard.lock()
+        touched = list(self.touched)
+        self.touched = collections.OrderedDict()
+        self.lastTouch = time.monotonic()
+        self.guard.unlock()
+        now = time.time_ns()
+        for i, key in enumerate(touched):
+            try:
+                os.utime(self.path(key), ns=(now + i, now + i))
+            except OSError:
+                pass
+
+    def put(self, key, blob):
+        path = self.path(key)
+        tmp = path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except OSError:
+            return
+
+        self.guard.lock()
+        self.total += len(blob) - self.entries.get(key, 0)
+        self.entries[key] = len(blob)
+        self.entries.move_to_end(key)
+        evicted = []
+        while self.total > self.limit and len(self.entries) > 1:
+            old, size = self.entries.popitem(last=False)
+            self.total -= size
+            evicted += [old]
+        self.guard.unlock()
+
+        for old in evicted:
+            try:
+                os.remove(self.path(old))
+            except OSError:
+                pass
+
+    def discard(self, key):
+        self.guard.lock()
+        if key in self.entries:
+            self.total -= self.entries.pop(key)
+        self.touched.pop(key, None)
+        self.guard.unlock()
+
+class ThumbnailIndexRunnable(QRunnable):
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def run(self):
+        self.cache.load()
+
+class ThumbnailMemoryCache():
+    def __init__(self, limit):
+        self.limit = limit
+        self.entries = collections.OrderedDict()
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    def get(self, file, stamp):
+        image = self.peek(file, stamp)
+        if image is not None:
+            self.entries.move_to_end(file)
+            self.hits += 1
+        else:
+            self.misses += 1
+        return image
+
+    def put(self, file, image, stamp):
+        self.remove(file)
+        self.entries[file] = (stamp, image)
+        self.total += image.sizeInBytes()
+        while self.total > self.limit and len(self.entries) > 1:
+            _, (_, old) = self.entries.popitem(last=False)
+            self.total -= old.sizeInBytes()
+            self.evictions += 1
+
+    def remove(self, file):
+        if file in self.entries:
+            self.total -= self.entries.pop(file)[1].sizeInBytes()
+
+    def peek(self, file, stamp):
+        # entries made from an older version of the file are dropped
+        entry = self.entries.get(file, None)
+        if entry and entry[0] != stamp:
+            self.remove(file)
+            self.stale += 1
+            return None
+        return entry[1] if entry else None
+
+    def has(self, file, stamp):
+        return self.peek(file, stamp) is not None
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.total, "limit": self.limit, "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "stale": self.stale}
 
 class ThumbnailStorage(QObject):
     instance = None
-    def __init__(self, size, big_size, quality, parent=None):
+    def __init__(self, size, big_size, quality, parent=None, folder="", limit=0, memory=(128*1024*1024, 64*1024*1024)):
         super().__init__(parent)
-        self.cache = {size: {}, big_size: {}}
+        self.cache = {size: ThumbnailMemoryCache(memory[0]), big_size: ThumbnailMemoryCache(memory[1])}
         self.guard = QMutex()
+        self.quality = quality
+        self.inflight = {}
+        self.inflightGuard = QMutex()
+        self.coalesced = 0
+        self.cancelled = 0
+        self.requests = 0
+        self.pool = pools.get("decode")
         ThumbnailStorage.instance = self
 
+        self.disk = None
+        if folder and limit > 0:
+            self.disk = ThumbnailDiskCache(folder, limit)
+
         self.async_provider = AsyncThumbnailProvider(size, quality)
+        self.prefetch_provider = AsyncThumbnailProvider(size, quality, True)
         self.sync_provider = SyncThumbnailProvider(size, quality)
         self.big_provider = AsyncThumbnailProvider(big_size, quality)
 
-    def get(self, file, size):
+        if filesystem.Watcher.instance:
+            filesystem.Watcher.instance.folder_diff.connect(self.onFolderDiff)
+            filesystem.Watcher.instance.file_changed.connect(self.remove)
+
+    def stamp(self, file):
+        # files in watched folders were already stat'd by the last scan
+        watcher = filesystem.Watcher.instance
+        return (watcher and watcher.stamp(file)) or file_stamp(file)
+    def get(self, file, size, stamp=None):
+        file = filesystem.canonical(file)
+        stamp = stamp or self.stamp(file)
         self.guard.lock()
-        image = self.cache[size].get(file, None)
+        image = self.cache[size].get(file, stamp)
         self.guard.unlock()
+        if image is None:
+            image = self.load(file, size, stamp)
+            if image is not None:
+                self.guard.lock()
+                self.cache[size].put(file, image, stamp)
+                self.guard.unlock()
         return image
-    def put(self, file, image, size):
+    def load(self, file, size, stamp):
+        # reads and decodes a disk cache entry, only ever off the GUI thread
+        if not self.disk:
+            return None
+        key = self.disk.key(file, size, stamp)
+        blob = key and self.disk.get(key)
+        return decode_thumbnail(blob) if blob else None
+    def put(self, file, image, size, persist=True, stamp=None):
+        file = filesystem.canonical(file)
+        stamp = stamp or file_stamp(file)
         self.guard.lock()
-        self.cache[size][file] = image
+        self.cache[size].put(file, image, stamp)
         self.guard.unlock()
+        if persist:
+            self.persist(file, image, size, stamp)
+    def persist(self, file, image, size, stamp=None):
+        # only the disk cache needs an encoded copy
+        if self.disk:
+            key = self.disk.key(file, size, stamp or file_stamp(file))
+            if key:
+                self.disk.put(key, encode_thumbnail(image, self.quality))
     def has(self, file, size):
+        # only memory hits are cheap enough for the GUI thread, disk hits load through the async provider
+        file = filesystem.canonical(file)
+        stamp = self.stamp(file)
         self.guard.lock()
-        out = file in self.cache[size]
+        out = self.cache[size].has(file, stamp)
         self.guard.unlock()
         return out
+    def flush(self):
+        if self.disk:
+            self.disk.flush()
     def remove(self, file):
+        file = filesystem.canonical(file)
         self.guard.lock()
         for size in self.cache:
-            if file in self.cache[size]:
-                del self.cache[size][file]
+            self.cache[size].remove(file)
         self.guard.unlock()
     def removeAll(self, files):
+        files = [filesystem.canonical(file) for file in files]
         self.guard.lock()
         for size in self.cache:
             for file in files:
-                if file in self.cache[size]:
-                    del self.cache[size][file]
+                self.cache[size].remove(file)
+        self.guard.unlock()
+    def transfer(self, files, move=False):
+        # thumbnails follow files copied or moved by the app, (source, source stamp, destination, destination stamp)
+        for src, srcStamp, dst, dstStamp in files:
+            src, dst = filesystem.canonical(src), filesystem.canonical(dst)
+            for size in self.cache:
+                self.guard.lock()
+                image = self.cache[size].peek(src, srcStamp)
+                if image is not None:
+                    self.cache[size].put(dst, image, dstStamp)
+                if move:
+                    self.cache[size].remove(src)
+                self.guard.unlock()
+                if self.disk:
+                    key = self.disk.key(src, size, srcStamp)
+                    blob = key and self.disk.get(key)
+                    if blob:
+                        self.disk.put(self.disk.key(dst, size, dstStamp), blob)
+    @pyqtSlot(str, list, list, list, list)
+    def onFolderDiff(self, folder, files, idxs, stats, removed):
+        # entries that already match the new file, like ones seeded at save time, are kept
+        files = [filesystem.canonical(file) for file in files]
+        removed = [filesystem.canonical(file) for file in removed]
+        self.guard.lock()
+        for size in self.cache:
+            for file, stamp in zip(files, stats):
+                self.cache[size].peek(file, tuple(stamp))
+            for file in removed:
+                self.cache[size].remove(file)
+        self.guard.unlock()
+    def seed(self, file, image):
+        # thumbnails of an image that was just saved, so the file never needs decoding again
+        file = filesystem.canonical(file)
+        stamp = file_stamp(file)
+        for size in self.cache:
+            self.put(file, make_thumbnail(image, size), size, True, stamp)
+    def stats(self):
+        self.guard.lock()
+        out = {f"{w}x{h}": cache.stats() for (w, h), cache in self.cache.items()}
         self.guard.unlock()
+        out["coalesced"] = self.coalesced
+        out["cancelled"] = self.cancelled
+        return out
+    def request(self, file, size, quality, callback, prefetch=False, stamp=None):
+        # concurrent requests for the same thumbnail share one job
+        # the newest requests run first, prefetches only once nothing visible is waiting
+        file = filesystem.canonical(file)
+        self.inflightGuard.lock()
+        self.requests += 1
+        priority = self.requests - (PREFETCH_PENALTY if prefetch else 0)
+        self.guard.lock()
+        image = self.cache[size].get(file, stamp)
+        self.guard.unlock()
+        if image is None:
+            job = self.inflight.get((file, size), None)
+            if job:
+                self.coalesced += 1
+                if priority > job.priority and self.pool.tryTake(job):
+                    job.priority = priority
+                    self.pool.start(job, priority)
+            else:
+                job = ThumbnailResponseRunnable(file, size, quality, stamp)
+                job.priority = priority
+                self.inflight[(file, size)] = job
+                self.pool.start(job, priority)
+            job.waiters += [callback]
+            job.signals.done.connect(callback)
+        self.inflightGuard.unlock()
+        return image
+    def cancel(self, file, size, callback):
+        # queued jobs nobody is waiting for anymore are dropped
+        file = filesystem.canonical(file)
+        self.inflightGuard.lock()
+        job = self.inflight.get((file, size), None)
+        if job and callback in job.waiters:
+            job.waiters.remove(callback)
+            job.signals.done.disconnect(callback)
+            if not job.waiters and self.pool.tryTake(job):
+                del self.inflight[(file, size)]
+                self.cancelled += 1
+        self.inflightGuard.unlock()
+    def finish(self, file, size):
+        self.inflightGuard.lock()
+        self.inflight.pop((file, size), None)
+        self.inflightGuard.unlock()
 
 class ThumbnailResponseRunnableSignals(QObject):
     done = pyqtSignal('QImage')
 
 class ThumbnailResponseRunnable(QRunnable):
-    def __init__(self, file, size, quality):
+    def __init__(self, file, size, quality, stamp=None):
         super().__init__()
         self.size = size
         self.quality = quality
         self.file = file
+        self.stamp = stamp
         self.signals = ThumbnailResponseRunnableSignals()
         self.image = None
+        self.priority = 0
+        self.waiters = []
 
     def run(self):
+        # disk cache hits are decoded here as well, so they get the same priorities and cancellation
+        cached = False
         try:
-            blob = get_thumbnail(self.file, self.size, self.quality)
-            ThumbnailStorage.instance.put(self.file, blob, self.size)
-            self.image = QImage.fromData(QByteArray(blob), "JPG")
+            self.image = ThumbnailStorage.instance.load(self.file, self.size, self.stamp)
+            cached = self.image is not None
+            if not cached:
+                self.image = get_thumbnail(self.file, self.size)
+            ThumbnailStorage.instance.put(self.file, self.image, self.size, False, self.stamp)
         except Exception as e:
             #print(e)
             self.image = QImage()
 
+        # later requests find the image in the cache, the ones already waiting get the signal
+        ThumbnailStorage.instance.finish(self.file, self.size)
         self.signals.done.emit(self.image)
 
+        if not cached and not self.image.isNull():
+            ThumbnailStorage.instance.persist(self.file, self.image, self.size, self.stamp)
+
 class ThumbnailResponse(QQuickImageResponse):
-    def __init__(self, file, pool, size, quality):
+    def __init__(self, file, size, quality, prefetch=False):
         super().__init__()
         file = QUrl.fromLocalFile(file).toLocalFile()
-        blob = ThumbnailStorage.instance.get(file, size)
-        if not blob:
-            runnable = ThumbnailResponseRunnable(file, size, quality)
-            runnable.signals.done.connect(self.onDone)
-            pool.start(runnable)
-        else:
-            self.image = QImage.fromData(QByteArray(blob), "JPG")
-            self.finished.emit()       
+        self.file = file
+        self.size = size
+        self.pending = True
+        stamp = ThumbnailStorage.instance.stamp(file)
+        image = ThumbnailStorage.instance.request(file, size, quality, self.onDone, prefetch, stamp)
+        if image is not None:
+            self.pending = False
+            self.image = image
+            self.finished.emit()
     
     @pyqtSlot('QImage')
     def onDone(self, image):
+        if not self.pending:
+            return
+        self.pending = False
         self.image = QImage(image)
         self.finished.emit()
+
+    def cancel(self):
+        if not self.pending:
+            return
+        self.pending = False
+        ThumbnailStorage.instance.cancel(self.file, self.size, self.onDone)
+        self.image = QImage()
+        self.finished.emit()
     
     def textureFactory(self):
         self.texture = QQuickTextureFactory.textureFactoryForImage(self.image)
         return self.texture
 
 class AsyncThumbnailProvider(QQuickAsyncImageProvider):
-    def __init__(self, size, quality):
+    def __init__(self, size, quality, prefetch=False):
         super(AsyncThumbnailProvider, self).__init__()
         self.size = size
         self.quality = quality
-        self.pool = QThreadPool.globalInstance()
+        self.prefetch = prefetch
 
     def requestImageResponse(self, path, size):
         file = QUrl.fromPercentEncoding(path.encode('utf-8'))
-        return ThumbnailResponse(file, self.pool, self.size, self.quality)
+        return ThumbnailResponse(file, self.size, self.quality, self.prefetch)
 
 class SyncThumbnailProvider(QQuickImageProvider):
     def __init__(self, size, quality):
@@ -123,12 +489,11 @@ class SyncThumbnailProvider(QQuickImageProvider):
     def requestImage(self, path, size):
         file = QUrl.fromPercentEncoding(path.encode('utf-8'))
         try:
-            blob = ThumbnailStorage.instance.get(file, self.size)
-            if not blob:
-                blob = get_thumbnail(file, self.size, self.quality)
-                ThumbnailStorage.instance.put(file, blob, self.size)
-
-            image = QImage.fromData(QByteArray(blob), "JPG")
+            stamp = ThumbnailStorage.instance.stamp(file)
+            image = ThumbnailStorage.instance.get(file, self.size, stamp)
+            if image is None:
+                image = get_thumbnail(file, self.size)
+                ThumbnailStorage.instance.put(file, image, self.size, True, stamp)
             return image, image.size()
         except Exception as e:
             #print(e)